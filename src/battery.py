@@ -1,7 +1,11 @@
-from typing import List, Literal
+from typing import Dict, List, Literal
 from simulator_types import Percentage, Watt, Volt
+from battery_bank import BatteryBank
+from timeseries import TimeSeries, RetentionPolicy, STATIC
 from utils import calculate_watts, uuid
 
+import threading
+
 
 class LoadError(Exception):
     """Raised on load imbalance."""
@@ -10,8 +14,8 @@ class LoadError(Exception):
 class Battery:
     """A battery class."""
     
-    def __init__(self, volts: int = 12, amps: int = 50):
-        self._id = uuid('BATTERY')
+    def __init__(self, volts: int = 12, amps: int = 50, battery_id: str = None):
+        self._id = battery_id or uuid('BATTERY')
         self._volts: Volt = volts
         self._state_of_charge: Percentage = 0.01
         self._minimum_power: Watt = 0
@@ -21,7 +25,16 @@ class Battery:
         self._amperes: int = amps
         self._available_power: Watt = calculate_watts(self._volts * self._state_of_charge, self._amperes)
         self._capacity: Watt = calculate_watts(self._volts, self._amperes)
-        self._time_series = []
+        self._time_series = TimeSeries(
+            {
+                'battery_id': STATIC,
+                'capacity': STATIC,
+                'state_of_charge': 'f8',
+                'available_power': 'f8',
+                'voltage': 'f8'
+            },
+            static={ 'battery_id': self._id, 'capacity': self._capacity }
+        )
 
     def status(self):
         state = {
@@ -32,16 +45,19 @@ class Battery:
             'available_power': self._available_power,
             'voltage': self._available_power / self._amperes
         }
-        self._time_series.append(state)
+        self._time_series.append(state['state_of_charge'], state['available_power'], state['voltage'])
         return state
     
     def charge(self, power: Watt):
-        """Add power to battery."""
+        """Add power to battery, return the power accepted."""
         if power > self._max_charge_rate:
             power = self._max_charge_rate     # limit power to max rate
+        accepted = 0
         if self._available_power + power <= self._capacity:
             self._available_power += power
+            accepted = power
         self._state_of_charge = self._available_power / self._capacity   
+        return accepted
         
     def discharge(self, power: Watt):
         """Discharge power from battery."""
@@ -67,15 +83,29 @@ class Battery:
 class BatteryArray:
     """Creates a single interface for multiple connected batteries."""
     
-    def __init__(self, connection_type: Literal['series', 'parallel'] = 'series'):
-        """Create an empty battery array."""
+    def __init__(self, connection_type: Literal['series', 'parallel'] = 'series', vectorized: bool = True):
+        """Create an empty battery array.
+
+        connection_type: how batteries are wired, which decides how power is shared (see BatteryBank).
+        vectorized: model all batteries in one pass with a BatteryBank. The battery by battery
+            model shares power equally, whatever the connection type.
+        """
+        if connection_type not in ('series', 'parallel'):
+            raise ValueError(f'UNKNOWN_CONNECTION_TYPE: {connection_type}')
         self._id = uuid('B_ARRAY')
         self._battery_array: List[Battery] = []
         self._capacity: Volt = 0
         self._voltage: Volt = 0
         self._avg_state_of_charge = 0.0
         self._total_available_power: Watt = 0
+        self._energy_in: Watt = 0                       # running totals, in watts per tick
+        self._energy_out: Watt = 0
         self._connection_type: str = connection_type
+        self._retention: RetentionPolicy = None
+        self._slots: Dict[str, int] = {}                # battery id -> position in self._battery_array
+        self._vectorized: bool = vectorized
+        self._battery_bank: BatteryBank = None           # built lazily, dropped on reconfiguration
+        self._lock = threading.Lock()                    # reconfiguration waits for charge, discharge and status
         self._time_series = []
         
     def __iter__(self):
@@ -84,65 +114,182 @@ class BatteryArray:
             
     def __len__(self):
         return len(self._battery_array)
+
+    def __contains__(self, battery_id: str):
+        return battery_id in self._slots
         
     def add(self, battery: Battery):
         """Connect a new battery."""
         # todo: validate battery compatability
-        self._battery_array.append(battery)
+        if self._retention is not None:
+            battery._time_series.set_retention(self._retention)
+        with self._lock:
+            self._slots[battery._id] = len(self._battery_array)
+            self._battery_array.append(battery)
+            if self._battery_bank is not None:
+                self._battery_bank.add(battery)
+        return { 'result': 'SUCCESS' }
+
+    def add_many(self, batteries: List[Battery]):
+        """Connect several batteries in one operation."""
+        if self._retention is not None:
+            for battery in batteries:
+                battery._time_series.set_retention(self._retention)
+        with self._lock:
+            for battery in batteries:
+                self._slots[battery._id] = len(self._battery_array)
+                self._battery_array.append(battery)
+            if self._battery_bank is not None:
+                self._battery_bank.extend(batteries)
         return { 'result': 'SUCCESS' }
 
+    def battery(self, battery_id: str) -> Battery:
+        """Get target battery."""
+        try:
+            return self._battery_array[self._slots[battery_id]]
+        except KeyError:
+            raise ValueError('BATTERY_NOT_FOUND')
+
     def get(self, battery_id: str):
         """Get target battery details."""
-        for battery in self._battery_array:
-            if battery._id == battery_id:
-                return battery.json()
-        raise ValueError('BATTERY_NOT_FOUND')
+        return self.battery(battery_id).json()
         
+    def remove_many(self, battery_ids: List[str]):
+        """Disconnect several batteries. Unknown ids are rejected before any battery is removed;
+        repeated ids remove their battery once."""
+        battery_ids = list(dict.fromkeys(battery_ids))
+        with self._lock:
+            [self.battery(battery_id) for battery_id in battery_ids]
+            for battery_id in battery_ids:
+                self._remove(battery_id)
+        return { 'result': 'SUCCESS' }
+
     def remove(self, battery_id):
-        for battery in self._battery_array:
-            if battery._id == battery_id:
-                self._battery_array.pop(self._battery_array.index(battery))
-                return { 'result': 'SUCCESS' }
-        raise ValueError('BATTERY_NOT_FOUND')
+        """Disconnect a battery. The last battery takes the removed battery's slot."""
+        with self._lock:
+            self._remove(battery_id)
+        return { 'result': 'SUCCESS' }
+
+    def _remove(self, battery_id: str):
+        """Swap-remove a battery. Caller holds self._lock."""
+        battery = self.battery(battery_id)
+        if self._battery_bank is not None:
+            self._battery_bank.sync()                    # leave the battery with its latest charge
+        slot = self._slots.pop(battery_id)
+        last = self._battery_array.pop()
+        if last is not battery:
+            self._battery_array[slot] = last
+            self._slots[last._id] = slot
+        if self._battery_bank is not None:
+            self._battery_bank.remove(slot)
         
+    def set_retention(self, policy: RetentionPolicy):
+        """Apply a retention policy to all current and future batteries."""
+        self._retention = policy
+        for battery in self._battery_array:
+            battery._time_series.set_retention(policy)
+
+    def invalidate(self):
+        """Discard the battery bank so it is rebuilt from the battery objects, e.g. after
+        changing their settings directly."""
+        with self._lock:
+            if self._battery_bank is not None:
+                self._battery_bank.sync()
+            self._battery_bank = None
+
     def connected_batteries(self):
         """Return all connected batteries."""
         return self._battery_array
         
     def charge(self, power: Watt):
-        """Charge connected batteries, return state"""
-        self._distribute_charge(power)
+        """Charge connected batteries, return power accepted."""
+        with self._lock:
+            if self._vectorized:
+                accepted = self._bank().charge(power)
+            else:
+                accepted = self._distribute_charge(power)
+        self._energy_in += accepted
+        return accepted
         
     def discharge(self, power: Watt):
-        """Discharge power from connected batteries."""
-        try:
-            self._distribute_discharge(power)
-            return power
-        except LoadError:
-            return 0
+        """Discharge power from connected batteries, return power supplied."""
+        with self._lock:
+            if self._vectorized:
+                supplied = self._bank().discharge(power)
+                self._energy_out += supplied
+                return supplied
+            try:
+                self._distribute_discharge(power)
+                self._energy_out += power
+                return power
+            except LoadError:
+                return 0
+
+    def discharge_limit(self) -> Watt:
+        """Return the most power one discharge can draw without any battery refusing its share."""
+        with self._lock:
+            if self._vectorized:
+                return self._bank().discharge_limit()
+            if not self._battery_array:
+                return 0
+            headroom = min([
+                min(battery._max_discharge_rate, battery._available_power - battery._minimum_power)
+                for battery in self._battery_array
+            ])
+            return max(0, headroom * len(self._battery_array))
+
+    def _bank(self) -> BatteryBank:
+        """Return the battery bank, building it if needed. Caller holds self._lock."""
+        if self._battery_bank is None:
+            self._battery_bank = BatteryBank(self._battery_array, self._connection_type)
+        return self._battery_bank
     
     def _distribute_charge(self, power: Watt):
         """Distribute charge equally amongst connected batteries."""
         power_per_battery = power / len(self._battery_array)
-        [battery.charge(power_per_battery) for battery in self._battery_array]
+        return sum([battery.charge(power_per_battery) for battery in self._battery_array])
     
     def _distribute_discharge(self, power: Watt):
         """Distribute discharge equally amongst connected batteries."""
         power_per_battery = power / len(self._battery_array)
         [battery.discharge(power_per_battery) for battery in self._battery_array]
 
-    def json(self):
-        """Return json representation of battery array."""
-        battery_details = [battery.status() for battery in self._battery_array]
-        avg_voltage = sum([battery['available_power'] for battery in battery_details]) / len(battery_details)
-        avg_state_of_charge = sum([battery['state_of_charge'] for battery in battery_details]) / len(battery_details)
-        total_power = sum([battery['available_power'] for battery in battery_details])
-        self._total_available_power = total_power
-        self._avg_state_of_charge = avg_state_of_charge
-        self._voltage = avg_voltage
+    def status(self):
+        """Record a sample for every battery, return array aggregates. Called once per tick."""
+        with self._lock:
+            if self._vectorized:
+                aggregates = self._bank().status()
+            else:
+                battery_details = [battery.status() for battery in self._battery_array]
+                total_power = sum([battery['available_power'] for battery in battery_details])
+                aggregates = {
+                    'total_available_power': total_power,
+                    'available_power': total_power / len(battery_details),
+                    'avg_state_of_charge': sum([
+                        battery['state_of_charge'] for battery in battery_details
+                    ]) / len(battery_details)
+                }
+        self._total_available_power = aggregates['total_available_power']
+        self._avg_state_of_charge = aggregates['avg_state_of_charge']
+        self._voltage = aggregates['available_power']
         return {
             'array_id': self._id,
-            'available_power': avg_voltage,
-            'batteries': battery_details,
-            'avg_state_of_charge': avg_state_of_charge
+            'available_power': aggregates['available_power'],
+            'avg_state_of_charge': aggregates['avg_state_of_charge']
         }
+
+    def json(self):
+        """Return json representation of battery array. Records a sample, like status."""
+        details = self.status()
+        details['batteries'] = [
+            {
+                'index': len(battery._time_series) - 1,
+                'battery_id': battery._id,
+                'capacity': battery._capacity,
+                'state_of_charge': battery._state_of_charge,
+                'available_power': battery._available_power,
+                'voltage': battery._available_power / battery._amperes
+            }
+            for battery in self._battery_array
+        ]
+        return details
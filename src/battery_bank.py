@@ -0,0 +1,153 @@
+import numpy as np
+
+from typing import List
+
+
+class BatteryBank:
+    """Array-backed model of a battery array. Charges, discharges and reports every cell
+    in one pass.
+
+    Cell parameters and state are held as parallel arrays, one slot per battery, in the
+    same order as the owning array's batteries. Power is split according to topology:
+
+    series: the same current flows through every cell, so power divides by voltage share,
+        a charge rate limit on one cell throttles the whole string, and the string takes
+        or gives its share only if every cell can.
+    parallel: cells share a voltage, so power divides by capacity share and each cell is
+        limited independently.
+
+    Each cell follows Battery.charge and Battery.discharge: it takes its whole (rate
+    limited) share if that fits below capacity and gives its whole share if that leaves
+    it above its minimum, otherwise nothing. A share above a cell's discharge rate
+    refuses the whole discharge.
+
+    State is copied back to the battery objects (and their time series) by status, once
+    per tick, so the per-battery api is unchanged.
+    """
+
+    def __init__(self, batteries: List['Battery'], topology: str = 'series'):
+        """Build bank from existing batteries, taking over their current state."""
+        if topology not in ('series', 'parallel'):
+            raise ValueError(f'UNKNOWN_TOPOLOGY: {topology}')
+        self._batteries = list(batteries)
+        self._topology: str = topology
+        rows = [self._row(battery) for battery in self._batteries]
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.array([row[name] for row in rows], dtype=dtype))
+
+    _COLUMNS = {
+        '_volts': float,
+        '_amperes': float,
+        '_capacity': float,
+        '_available_power': float,
+        '_minimum_power': float,
+        '_max_charge_rate': float,
+        '_max_discharge_rate': float
+    }
+
+    @staticmethod
+    def _row(battery: 'Battery') -> dict:
+        """Return a battery's values for every bank column."""
+        return {
+            '_volts': battery._volts,
+            '_amperes': battery._amperes,
+            '_capacity': battery._capacity,
+            '_available_power': battery._available_power,
+            '_minimum_power': battery._minimum_power,
+            '_max_charge_rate': battery._max_charge_rate,
+            '_max_discharge_rate': battery._max_discharge_rate
+        }
+
+    def __len__(self):
+        return len(self._batteries)
+
+    def add(self, battery: 'Battery'):
+        """Append a battery in the last slot."""
+        self.extend([battery])
+
+    def extend(self, batteries: List['Battery']):
+        """Append several batteries, growing every column once."""
+        self._batteries.extend(batteries)
+        rows = [self._row(battery) for battery in batteries]
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.array([row[name] for row in rows], dtype=dtype)]))
+
+    def remove(self, slot: int):
+        """Remove the battery in slot by moving the last battery into its place."""
+        last = len(self._batteries) - 1
+        self._batteries[slot] = self._batteries[last]
+        self._batteries.pop()
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            column[slot] = column[last]
+            setattr(self, name, column[:last])
+
+    def _shares(self) -> np.ndarray:
+        """Fraction of array power handled by each cell."""
+        weights = self._volts if self._topology == 'series' else self._capacity
+        return weights / weights.sum()
+
+    def charge(self, power: float) -> float:
+        """Charge every cell, return the power accepted."""
+        if len(self._batteries) == 0 or power <= 0:
+            return 0.0
+        offered = power * self._shares()
+        if self._topology == 'parallel':
+            offered = np.minimum(offered, self._max_charge_rate)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = np.where(offered > 0, self._max_charge_rate / offered, np.inf)
+            offered = offered * min(1.0, float(ratios.min()))      # one current for the string
+        accepted = self._limit(offered, self._available_power + offered <= self._capacity)
+        self._available_power += accepted
+        return float(accepted.sum())
+
+    def discharge(self, power: float) -> float:
+        """Draw power from every cell, return the power supplied. Nothing is drawn if a
+        cell would exceed its discharge rate."""
+        if len(self._batteries) == 0 or power <= 0:
+            return 0.0
+        requested = power * self._shares()
+        if (requested > self._max_discharge_rate).any():
+            return 0.0
+        supplied = self._limit(requested, self._available_power - requested > self._minimum_power)
+        self._available_power -= supplied
+        return float(supplied.sum())
+
+    def discharge_limit(self) -> float:
+        """Return the most power one discharge can draw without any cell refusing its share."""
+        if len(self._batteries) == 0:
+            return 0.0
+        headroom = np.minimum(self._max_discharge_rate, self._available_power - self._minimum_power)
+        return max(0.0, float((headroom / self._shares()).min()))
+
+    def _limit(self, power: np.ndarray, fits: np.ndarray) -> np.ndarray:
+        """Keep the power of cells that can take or give it whole, according to topology."""
+        if self._topology == 'parallel':
+            return np.where(fits, power, 0.0)
+        return power if fits.all() else np.zeros_like(power)     # one current for the string
+
+    def status(self) -> dict:
+        """Record a sample for every battery and return array aggregates."""
+        state_of_charge = self._available_power / self._capacity
+        voltage = self._available_power / self._amperes
+        for battery, available, charge, volts in zip(self._batteries, self._available_power.tolist(),
+                                                     state_of_charge.tolist(), voltage.tolist()):
+            battery._available_power = available
+            battery._state_of_charge = charge
+            battery._time_series.append(charge, available, volts)
+        count = len(self._batteries)
+        total = float(self._available_power.sum())
+        return {
+            'total_available_power': total,
+            'available_power': total / count if count else 0.0,
+            'avg_state_of_charge': float(state_of_charge.mean()) if count else 0.0
+        }
+
+    def sync(self):
+        """Copy current state back to the battery objects without recording a sample."""
+        state_of_charge = self._available_power / self._capacity
+        for battery, available, charge in zip(self._batteries, self._available_power.tolist(),
+                                              state_of_charge.tolist()):
+            battery._available_power = available
+            battery._state_of_charge = charge
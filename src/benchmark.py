@@ -0,0 +1,272 @@
+"""Benchmarks for the simulation core.
+
+Measures tick throughput across panel counts, battery counts, concurrent systems and
+history lengths, read latency as history grows, and memory per tick. Runs are seeded,
+so the same code gives the same simulated work, and results are written as json for
+comparison between branches:
+
+    python benchmark.py --output results.json
+    python benchmark.py --quick --compare results.json
+"""
+from typing import Callable, Dict, List
+
+from battery import Battery, BatteryArray
+from environment import Environment
+from pv_system import PhotoVoltaicSystem
+from scheduler import TickScheduler
+from solar_panel import SolarPanel, SolarArray
+
+from datetime import datetime, timezone
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+
+PANEL_SPEC = {
+    'standard_conditions': {
+        'power_rating': 100,
+        'efficiency': 0.23,
+        'temperature': { 'unit': 'Celcius', 'value': 25 }
+    },
+    'temp_coefficient': 0.02,
+    'area': 3
+}
+
+FULL = {
+    'panel_counts': [1, 10, 100, 1000],
+    'battery_counts': [1, 10, 100, 1000],
+    'concurrent_systems': [1, 4, 16, 64],
+    'history_lengths': [0, 1000, 10000, 50000],
+    'min_ticks': 50,
+    'budget_seconds': 5.0,
+    'latency_samples': 20,
+    'memory_ticks': 2000
+}
+
+QUICK = {
+    'panel_counts': [1, 10, 100],
+    'battery_counts': [1, 10, 100],
+    'concurrent_systems': [1, 4],
+    'history_lengths': [0, 1000],
+    'min_ticks': 20,
+    'budget_seconds': 1.0,
+    'latency_samples': 5,
+    'memory_ticks': 500
+}
+
+
+def build(panels: int = 4, batteries: int = 2, seed: int = 0, scheduler: TickScheduler = None) -> PhotoVoltaicSystem:
+    """Create a connected, active system that never reaches its final iteration."""
+    environment = Environment(seed=seed)
+    solar_array = SolarArray()
+    solar_array.add_many([SolarPanel({ 'environment': environment, **PANEL_SPEC }) for _ in range(panels)])
+    battery_array = BatteryArray()
+    battery_array.add_many([Battery(volts=12, amps=100) for _ in range(batteries)])
+    system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array,
+                                scheduler=scheduler)
+    system._max_iterations = sys.maxsize
+    system._connect()
+    system._active = True
+    return system
+
+
+def tick_rate(system: PhotoVoltaicSystem, min_ticks: int, budget_seconds: float) -> dict:
+    """Tick a system for at least budget_seconds and min_ticks ticks. Slow configurations
+    give up on min_ticks after four budgets."""
+    ticks = 0
+    started = time.perf_counter()
+    while True:
+        system._tick()
+        ticks += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= budget_seconds and (ticks >= min_ticks or elapsed >= budget_seconds * 4):
+            break
+    return { 'ticks': ticks, 'seconds': elapsed, 'ticks_per_second': ticks / elapsed }
+
+
+def latency(call: Callable, samples: int) -> dict:
+    """Return latency statistics of call, in milliseconds."""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'samples': samples,
+        'mean_ms': statistics.fmean(timings),
+        'median_ms': statistics.median(timings),
+        'max_ms': max(timings)
+    }
+
+
+def bench_panels(config: dict) -> List[dict]:
+    return [
+        { 'panels': count, **tick_rate(build(panels=count), config['min_ticks'], config['budget_seconds']) }
+        for count in config['panel_counts']
+    ]
+
+
+def bench_batteries(config: dict) -> List[dict]:
+    return [
+        { 'batteries': count, **tick_rate(build(batteries=count), config['min_ticks'], config['budget_seconds']) }
+        for count in config['battery_counts']
+    ]
+
+
+def bench_concurrency(config: dict) -> List[dict]:
+    """Aggregate throughput of many systems ticking back to back on a shared scheduler."""
+    results = []
+    for count in config['concurrent_systems']:
+        scheduler = TickScheduler()
+        try:
+            systems = [build(seed=seed, scheduler=scheduler) for seed in range(count)]
+            for system in systems:
+                system._update_interval = 0             # tick again as soon as a worker is free
+            started = time.perf_counter()
+            for system in systems:
+                scheduler.add(system)
+            time.sleep(config['budget_seconds'])
+            for system in systems:
+                system.stop()
+            elapsed = time.perf_counter() - started
+        finally:
+            scheduler.shutdown()
+        ticks = sum([system._iterations for system in systems])
+        results.append({
+            'systems': count,
+            'ticks': ticks,
+            'seconds': elapsed,
+            'ticks_per_second': ticks / elapsed,
+            'mean_tick_lag': scheduler.json()['mean_tick_lag']
+        })
+    return results
+
+
+def bench_history(config: dict) -> List[dict]:
+    """Tick rate and read latency after a system has recorded history_length ticks."""
+    results = []
+    system = build()
+    for length in config['history_lengths']:
+        while system._iterations < length:
+            system._tick()
+        samples = config['latency_samples']
+        results.append({
+            'history_length': system._iterations,
+            'tick': tick_rate(system, config['min_ticks'], config['budget_seconds'] / 4),
+            'json': latency(system.json, samples),
+            'system_data': latency(system.system_data, samples),
+            'panel_data': latency(system.panel_data, samples),
+            'cooling_data': latency(system.cooling_data, samples)
+        })
+    return results
+
+
+def bench_memory(config: dict) -> dict:
+    """Bytes allocated per tick, as seen by tracemalloc and by time series storage."""
+    system = build()
+    ticks = config['memory_ticks']
+    for _ in range(10):                                  # settle lazily built state, e.g. the panel bank
+        system._tick()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(ticks):
+        system._tick()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    series = system.time_series().values()
+    return {
+        'ticks': ticks,
+        'traced_bytes_per_tick': (after - before) / ticks,
+        'peak_traced_bytes': peak,
+        'series_bytes_per_tick': sum([value.nbytes for value in series]) / system._iterations
+    }
+
+
+def environment_details() -> dict:
+    """Describe where the benchmark ran."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor()
+    }
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'panels': bench_panels,
+    'batteries': bench_batteries,
+    'concurrency': bench_concurrency,
+    'history': bench_history,
+    'memory': bench_memory
+}
+
+
+def run(quick: bool = False, only: List[str] = None) -> dict:
+    """Run the selected benchmarks, return results."""
+    config = QUICK if quick else FULL
+    results = { 'environment': environment_details(), 'config': config, 'results': {} }
+    for name, benchmark in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        print(f'Running {name} benchmark...')
+        results['results'][name] = benchmark(config)
+    return results
+
+
+def _throughputs(results: dict) -> Dict[str, float]:
+    """Flatten ticks_per_second figures into { label: value } for comparison."""
+    flat = {}
+    for name, rows in results['results'].items():
+        if not isinstance(rows, list):
+            continue
+        for row in rows:
+            parameter, value = next(iter(row.items()))          # rows lead with the varied parameter
+            label = f'{parameter}={value}'
+            rate = row['ticks_per_second'] if 'ticks_per_second' in row else row['tick']['ticks_per_second']
+            flat[f'{name}[{label}]'] = rate
+    return flat
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """Return descriptions of throughputs that fell more than tolerance below the baseline."""
+    previous = _throughputs(baseline)
+    regressions = []
+    for label, rate in _throughputs(current).items():
+        if label in previous and rate < previous[label] * (1 - tolerance):
+            regressions.append(f'{label}: {previous[label]:.1f} -> {rate:.1f} ticks/s')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the PV simulation core.')
+    parser.add_argument('--output', default='benchmark.json', help='where to write results')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast smoke run')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS.keys()), help='run selected benchmarks')
+    parser.add_argument('--compare', help='baseline results to check for throughput regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed fractional slowdown')
+    args = parser.parse_args()
+
+    results = run(args.quick, args.only)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if regressions else 0)
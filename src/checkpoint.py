@@ -0,0 +1,458 @@
+from typing import Dict, List, Tuple
+
+from battery import Battery, BatteryArray
+from clock import SimulationClock
+from environment import Environment
+from pv_system import PhotoVoltaicSystem
+from scheduler import TickScheduler
+from solar_panel import SolarPanel, SolarArray
+from timeseries import TimeSeries, RetentionPolicy
+from weather import open_dataset
+
+from datetime import datetime
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+
+_SEGMENT = struct.Struct('<I')          # length of a history segment's json header
+_TICK = '@tick'                         # column name for clock ticks of series with retention
+
+
+def _system_state(system: PhotoVoltaicSystem) -> dict:
+    """Return the full state of a system, excluding raw history rows."""
+    environment = system._environment
+    inverter = system._inverter
+    return {
+        'system_id': system._id,
+        'active': system._active,
+        'environment': {
+            'start_time': environment.clock._start_time.isoformat(),
+            'step_seconds': environment.clock.step_seconds,
+            'steps': environment.clock.steps,
+            'seed': environment.seed,
+            'random': environment.random.bit_generator.state,
+            'weather': environment.weather.path if environment.weather is not None else None
+        },
+        'retention': system._retention.json() if system._retention is not None else None,
+        'update_interval': system._update_interval,
+        'iterations_per_day': system._iterations_per_day,
+        'max_iterations': system._max_iterations,
+        'iterations': system._iterations,
+        'total_available_volts': system._total_available_volts,
+        'total_solar_output': system._total_solar_output,
+        'aggregated_solar_output': system._aggregated_solar_output,
+        'peak_solar_output': system._peak_solar_output,
+        'panel_cooling': system._panel_cooling,
+        'metadata': system._metadata,
+        'inverter': {
+            'max_output': inverter._max_output,
+            'output_power': inverter._output_power,
+            'load_error': inverter._load_error,
+            'load_errors': inverter._load_errors,
+            'energy_delivered': inverter._energy_delivered,
+            'active': inverter._active,
+            'appliances': inverter._appliances,
+            'load': inverter._load,
+            'settlement': inverter._settlement
+        },
+        'panels': {
+            'vectorized': system._panels._vectorized,
+            'array_temperature': system._panels._array_temperature,
+            'total_output': system._panels._total_output,
+            'panels': [
+                {
+                    'panel_id': panel._id,
+                    'power_rating': panel._power_rating,
+                    'efficiency': panel._efficiency,
+                    'temp_coefficient': panel._temperature_coefficient,
+                    'optimal_temperature': panel._optimal_temperature,
+                    'area': panel._area,
+                    'current_temperature': panel._current_temperature,
+                    'current_output': panel._current_output,
+                    'cooling': {
+                        'cooling_id': panel._cooling_system._id,
+                        'max_output': panel._cooling_system._max_output,
+                        'watts_per_degree': panel._cooling_system._watts_per_degree,
+                        'current_output': panel._cooling_system._current_output,
+                        'active': panel._cooling_system._active,
+                        'load_errors': panel._cooling_system._load_errors
+                    }
+                }
+                for panel in system._panels
+            ]
+        },
+        'batteries': {
+            'connection_type': system._batteries._connection_type,
+            'vectorized': system._batteries._vectorized,
+            'energy_in': system._batteries._energy_in,
+            'energy_out': system._batteries._energy_out,
+            'avg_state_of_charge': system._batteries._avg_state_of_charge,
+            'total_available_power': system._batteries._total_available_power,
+            'voltage': system._batteries._voltage,
+            'batteries': [
+                {
+                    'battery_id': battery._id,
+                    'volts': battery._volts,
+                    'amps': battery._amperes,
+                    'state_of_charge': battery._state_of_charge,
+                    'available_power': battery._available_power,
+                    'minimum_power': battery._minimum_power,
+                    'max_charge_rate': battery._max_charge_rate,
+                    'max_discharge_rate': battery._max_discharge_rate,
+                    'depth_of_charge': battery._depth_of_charge
+                }
+                for battery in system._batteries
+            ]
+        }
+    }
+
+
+def _build_system(state: dict, scheduler: TickScheduler = None) -> PhotoVoltaicSystem:
+    """Rebuild a system, without history, from _system_state."""
+    environment_state = state['environment']
+    clock = SimulationClock(datetime.fromisoformat(environment_state['start_time']), environment_state['step_seconds'])
+    weather = environment_state.get('weather')
+    environment = Environment(clock, environment_state['seed'], open_dataset(weather) if weather else None)
+    environment.set_time(clock.advance(environment_state['steps']))
+    environment.random.bit_generator.state = environment_state['random']
+
+    panel_state = state['panels']
+    panels = []
+    for values in panel_state['panels']:
+        panel = SolarPanel({
+            'panel_id': values['panel_id'],
+            'cooling_id': values['cooling']['cooling_id'],
+            'environment': environment,
+            'standard_conditions': {
+                'power_rating': values['power_rating'],
+                'efficiency': values['efficiency'],
+                'temperature': { 'unit': 'Celcius', 'value': values['optimal_temperature'] }
+            },
+            'temp_coefficient': values['temp_coefficient'],
+            'area': values['area']
+        })
+        panel._current_temperature = values['current_temperature']
+        panel._current_output = values['current_output']
+        cooling = panel._cooling_system
+        cooling._max_output = values['cooling']['max_output']
+        cooling._watts_per_degree = values['cooling']['watts_per_degree']
+        cooling._current_output = values['cooling']['current_output']
+        cooling._active = values['cooling']['active']
+        cooling._load_errors = values['cooling']['load_errors']
+        panels.append(panel)
+    solar_array = SolarArray(vectorized=panel_state['vectorized'])
+    solar_array.add_many(panels)
+    solar_array._array_temperature = panel_state['array_temperature']
+    solar_array._total_output = panel_state['total_output']
+
+    battery_state = state['batteries']
+    batteries = []
+    for values in battery_state['batteries']:
+        battery = Battery(volts=values['volts'], amps=values['amps'], battery_id=values['battery_id'])
+        battery._state_of_charge = values['state_of_charge']
+        battery._available_power = values['available_power']
+        battery._minimum_power = values['minimum_power']
+        battery._max_charge_rate = values['max_charge_rate']
+        battery._max_discharge_rate = values['max_discharge_rate']
+        battery._depth_of_charge = values['depth_of_charge']
+        batteries.append(battery)
+    battery_array = BatteryArray(battery_state['connection_type'], vectorized=battery_state['vectorized'])
+    battery_array.add_many(batteries)
+    battery_array._energy_in = battery_state['energy_in']
+    battery_array._energy_out = battery_state['energy_out']
+    battery_array._avg_state_of_charge = battery_state['avg_state_of_charge']
+    battery_array._total_available_power = battery_state['total_available_power']
+    battery_array._voltage = battery_state['voltage']
+
+    system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array,
+                                scheduler=scheduler)
+    system._id = state['system_id']
+    if state['retention'] is not None:
+        system.set_retention(RetentionPolicy(
+            clock,
+            raw_samples=state['retention']['raw_samples'],
+            hourly_buckets=state['retention']['hourly_buckets'],
+            daily_buckets=state['retention']['daily_buckets']
+        ))
+    system._update_interval = state['update_interval']
+    system._iterations_per_day = state['iterations_per_day']
+    system._max_iterations = state['max_iterations']
+    system._iterations = state['iterations']
+    system._total_available_volts = state['total_available_volts']
+    system._total_solar_output = state['total_solar_output']
+    system._aggregated_solar_output = state['aggregated_solar_output']
+    system._peak_solar_output = state['peak_solar_output']
+    system._panel_cooling = state['panel_cooling']
+    system._metadata = state['metadata']
+
+    inverter = system._inverter
+    for key, value in state['inverter'].items():
+        setattr(inverter, f'_{key}', value)
+    inverter.connect_battery_array(battery_array)
+    for panel in solar_array:
+        panel._cooling_system.add_power_source(inverter)
+    return system
+
+
+class CheckpointStore:
+    """Durable snapshots of PV systems, so simulations survive restarts.
+
+    Each system gets a directory holding a zlib compressed json snapshot of its state
+    (parameters, running totals, battery charge, cooling outputs, inverter loads, random
+    stream) and an append-only history log. A checkpoint rewrites the snapshot but only
+    appends the history rows recorded since the previous checkpoint, so its cost follows
+    the tick rate rather than the length of the run. The log is rewritten with just the
+    live rows once it holds more than max_segments appends.
+
+    The snapshot records how many bytes of the log are valid and is replaced atomically
+    after the log is synced, so a crash mid-checkpoint leaves the previous checkpoint
+    intact. Loading is on demand: listing stored systems only reads directory names.
+    """
+
+    def __init__(self, directory: str, max_segments: int = 128):
+        self._directory: str = directory
+        self._max_segments: int = max_segments
+        self._lock = threading.Lock()
+        self._logs: Dict[str, dict] = {}               # system id -> log bookkeeping of the last checkpoint
+        self._signatures: Dict[str, tuple] = {}        # system id -> system signature at the last checkpoint
+        self._saves: int = 0
+        self._bytes_written: int = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, system_id: str):
+        return self._valid(system_id) and os.path.exists(self._state_path(system_id))
+
+    def system_ids(self) -> List[str]:
+        """Return ids of every stored system."""
+        return [
+            entry for entry in os.listdir(self._directory)
+            if os.path.exists(self._state_path(entry))
+        ]
+
+    def save(self, system: PhotoVoltaicSystem, registry=None) -> bool:
+        """Checkpoint a system. Safe to call while the system is running; the snapshot
+        is taken between ticks. Returns whether the system was saved.
+
+        registry: skip systems no longer registered in it. Checked under the store lock,
+        so a save cannot write back a system whose removal has deleted its checkpoint.
+        """
+        with self._lock:
+            if registry is not None and system._id not in registry:
+                return False
+            log = self._logs.get(system._id) or self._read_log_state(system._id)
+            compact = log['segments'] >= self._max_segments
+            written = {} if compact else log['written']
+            with system._lock:
+                state = _system_state(system)
+                signature = self._signature(system)
+                series = system.time_series()
+                state['series'] = { key: value.state() for key, value in series.items() }
+                lengths = { key: len(value) for key, value in series.items() }   # drops removed components
+                segment = {}
+                for key, value in series.items():
+                    start = max(written.get(key, 0), value.first_index)
+                    if start < lengths[key]:
+                        columns = { field: value.column(field, start, lengths[key]) for field in value.fields }
+                        if value._retention is not None:
+                            columns[_TICK] = value.ticks(start, lengths[key])
+                        segment[key] = (start, columns)
+            directory = self._system_directory(system._id)
+            os.makedirs(directory, exist_ok=True)
+            generation = log['generation'] + 1 if compact else log['generation']
+            history_bytes = 0 if compact else log['history_bytes']
+            segments = 0 if compact else log['segments']
+            if segment:
+                history_bytes += self._append_segment(self._log_path(system._id, generation), history_bytes, segment)
+                segments += 1
+            log = {
+                'generation': generation,
+                'history_bytes': history_bytes,
+                'segments': segments,
+                'written': lengths                   # as read under the lock; the system may have ticked since
+            }
+            state['log'] = log
+            encoded = zlib.compress(json.dumps(state, separators=(',', ':')).encode())
+            temporary = self._state_path(system._id) + '.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(encoded)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self._state_path(system._id))
+            if compact and generation > 0:
+                try:
+                    os.remove(self._log_path(system._id, generation - 1))
+                except FileNotFoundError:
+                    pass
+            self._logs[system._id] = log
+            self._signatures[system._id] = signature
+            self._saves += 1
+            self._bytes_written += len(encoded)
+        return True
+
+    def save_changed(self, registry) -> int:
+        """Checkpoint systems in registry that have ticked or been reconfigured since their
+        last checkpoint. Returns the number of systems saved."""
+        saved = 0
+        for system in registry:
+            if self._signatures.get(system._id) != self._signature(system):
+                saved += self.save(system, registry)
+        return saved
+
+    def load(self, system_id: str, scheduler: TickScheduler = None, resume: bool = True) -> PhotoVoltaicSystem:
+        """Rebuild a system from its last checkpoint.
+
+        resume: restart the simulation if it was running when checkpointed.
+        """
+        with self._lock:
+            try:
+                with open(self._state_path(system_id), 'rb') as file:
+                    state = json.loads(zlib.decompress(file.read()))
+            except FileNotFoundError:
+                raise ValueError('PVS_NOT_FOUND')
+            system = _build_system(state, scheduler)
+            series = system.time_series()
+            log = state['log']
+            self._restore_history(self._log_path(system_id, log['generation']), log['history_bytes'],
+                                  series, state['series'])
+            self._logs[system_id] = log
+            self._signatures[system_id] = self._signature(system)
+        if state['active'] and resume:
+            system.start()
+        return system
+
+    def delete(self, system_id: str):
+        """Forget a stored system."""
+        with self._lock:
+            self._logs.pop(system_id, None)
+            self._signatures.pop(system_id, None)
+            shutil.rmtree(self._system_directory(system_id), ignore_errors=True)
+
+    def start(self, registry, interval: float = 30):
+        """Checkpoint changed systems in registry every interval seconds, in the background."""
+        def checkpoint_periodically():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save_changed(registry)
+                except Exception as e:
+                    print(f'Checkpoint failed: {e}')
+        threading.Thread(target=checkpoint_periodically, daemon=True).start()
+
+    def json(self):
+        """Return store statistics."""
+        return {
+            'directory': self._directory,
+            'stored': len(self.system_ids()),
+            'saves': self._saves,
+            'state_bytes_written': self._bytes_written,
+            'max_segments': self._max_segments
+        }
+
+    @staticmethod
+    def _signature(system: PhotoVoltaicSystem) -> tuple:
+        """Cheap summary that changes whenever a system ticks or is reconfigured."""
+        return (
+            system._active, system._iterations, len(system._time_series), len(system._inverter._time_series),
+            len(system._panels), len(system._batteries), system._panel_cooling, id(system._metadata)
+        )
+
+    @staticmethod
+    def _valid(system_id: str) -> bool:
+        """Ids name a directory of the store, so they must be plain names."""
+        return system_id not in ('', '.', '..') and os.path.basename(system_id) == system_id
+
+    def _system_directory(self, system_id: str) -> str:
+        if not self._valid(system_id):
+            raise ValueError('PVS_NOT_FOUND')
+        return os.path.join(self._directory, system_id)
+
+    def _state_path(self, system_id: str) -> str:
+        return os.path.join(self._system_directory(system_id), 'state.z')
+
+    def _log_path(self, system_id: str, generation: int) -> str:
+        return os.path.join(self._system_directory(system_id), f'history.{generation}.log')
+
+    def _read_log_state(self, system_id: str) -> dict:
+        """Return log bookkeeping from a stored snapshot, or that of an empty log."""
+        try:
+            with open(self._state_path(system_id), 'rb') as file:
+                return json.loads(zlib.decompress(file.read()))['log']
+        except FileNotFoundError:
+            return { 'generation': 0, 'history_bytes': 0, 'segments': 0, 'written': {} }
+
+    def _append_segment(self, path: str, valid_bytes: int, segment: Dict[str, Tuple[int, dict]]) -> int:
+        """Append rows to a history log, discarding anything past valid_bytes (left by an
+        interrupted checkpoint). Returns the number of bytes appended."""
+        header = {}
+        blobs = []
+        for key, (start, columns) in segment.items():
+            header[key] = {
+                'start': start,
+                'rows': len(next(iter(columns.values()))),
+                'columns': [[name, values.dtype.str] for name, values in columns.items()]
+            }
+            blobs.extend([values.tobytes() for values in columns.values()])
+        encoded = json.dumps(header, separators=(',', ':')).encode()
+        with open(path, 'ab') as file:
+            file.truncate(valid_bytes)
+            file.write(_SEGMENT.pack(len(encoded)))
+            file.write(encoded)
+            for blob in blobs:
+                file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+        return _SEGMENT.size + len(encoded) + sum([len(blob) for blob in blobs])
+
+    def _restore_history(self, path: str, valid_bytes: int, series: Dict[str, TimeSeries], states: Dict[str, dict]):
+        """Refill every series with its raw rows from the history log."""
+        pieces: Dict[str, list] = { key: [] for key in series }
+        if valid_bytes > 0:
+            with open(path, 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    position = 0
+                    while position < valid_bytes:
+                        (length,) = _SEGMENT.unpack_from(buffer, position)
+                        position += _SEGMENT.size
+                        header = json.loads(buffer[position:position + length])
+                        position += length
+                        for key, description in header.items():
+                            rows = description['rows']
+                            columns = {}
+                            for name, dtype in description['columns']:
+                                dtype = np.dtype(dtype)
+                                if key in pieces:
+                                    columns[name] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=position).copy()
+                                position += dtype.itemsize * rows
+                            if key in pieces:
+                                pieces[key].append((description['start'], columns))
+                finally:
+                    buffer.close()
+        for key, value in series.items():
+            state = states[key]
+            first = state['dropped_chunks'] * state['chunk_size']
+            needed = state['length'] - first
+            fields = value.fields + ([_TICK] if value._retention is not None else [])
+            parts = { field: [] for field in fields }
+            for start, columns in pieces[key]:
+                rows = len(columns[fields[0]]) if fields else 0
+                low, high = max(first, start), min(state['length'], start + rows)
+                if low >= high:
+                    continue
+                for field in fields:
+                    parts[field].append(columns[field][low - start:high - start])
+            columns = {
+                field: np.concatenate(chunks) if chunks else np.empty(0) for field, chunks in parts.items()
+            }
+            if fields and len(columns[fields[0]]) != needed:
+                raise ValueError(f'CHECKPOINT_INCOMPLETE: {key}')
+            value.restore(state, columns, columns.get(_TICK))
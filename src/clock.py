@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+
+DEFAULT_START_TIME = datetime(2024, 5, 21, 4, 0)
+
+
+class SimulationClock:
+    """Discrete-event clock. Simulated time only moves when the clock is advanced."""
+
+    def __init__(self, start_time: datetime = DEFAULT_START_TIME, step_seconds: int = 300):
+        """Create a clock at start_time that moves step_seconds per step."""
+        self._start_time: datetime = start_time
+        self._step: timedelta = timedelta(seconds=step_seconds)
+        self._now: datetime = start_time
+        self._steps: int = 0
+
+    @property
+    def now(self) -> datetime:
+        return self._now
+
+    @property
+    def steps(self) -> int:
+        return self._steps
+
+    @property
+    def step_seconds(self) -> float:
+        return self._step.total_seconds()
+
+    def advance(self, steps: int = 1) -> datetime:
+        """Move the clock forward by a number of steps, return the new time."""
+        self._steps += steps
+        self._now = self._start_time + (self._step * self._steps)
+        return self._now
+
+    def peek(self, steps: int = 1) -> datetime:
+        """Return the time steps from now, without moving the clock."""
+        return self._start_time + (self._step * (self._steps + steps))
+
+    def reset(self, start_time: datetime = None) -> datetime:
+        """Rewind the clock, optionally to a new start time."""
+        if start_time is not None:
+            self._start_time = start_time
+        self._steps = 0
+        self._now = self._start_time
+        return self._now
+
+    def json(self):
+        """Return json representation of clock."""
+        return {
+            'start_time': str(self._start_time),
+            'current_time': str(self._now),
+            'step_seconds': self.step_seconds,
+            'steps': self._steps
+        }
@@ -0,0 +1,22 @@
+import pytest
+
+from benchmark import PANEL_SPEC, build
+from environment import Environment
+from pv_system import PhotoVoltaicSystem
+from solar_panel import SolarPanel
+
+
+@pytest.fixture
+def new_panel():
+    """Return a factory for panels in an environment."""
+    def panel(environment: Environment) -> SolarPanel:
+        return SolarPanel({ 'environment': environment, **PANEL_SPEC })
+    return panel
+
+
+@pytest.fixture
+def running_system():
+    """Return a factory for connected, active systems that are ticked by hand (see benchmark.build)."""
+    def system(seed: int = 0) -> PhotoVoltaicSystem:
+        return build(panels=3, batteries=2, seed=seed)
+    return system
@@ -1,23 +1,25 @@
 from simulator_types import Watt, Celcius
 from typing import List
 
-from inverter import Inverter
+from inverter import Inverter, LoadError
+from timeseries import TimeSeries, STATIC
 from utils import InsufficientPowerError, uuid
 
 
 class CoolingSystem:
     """Generic cooling system applied to a solar array."""
     
-    def __init__(self):
-        """Initialise a new cooling system."""
-        self._id: str = uuid('COOLING')
+    def __init__(self, panel_id: str = None, cooling_id: str = None):
+        """Initialise a new cooling system for the given panel."""
+        self._id: str = cooling_id or uuid('COOLING')
         self._max_output: Celcius = 15
         self._watts_per_degree: Watt = 15
         self._target_temparature: Celcius = 0
         self._current_output: Celcius = 0                   # controlled by corresponding solar panel
         self._power_source: Inverter = None
         self._active: bool = True
-        self._time_series: List[dict] = []
+        self._load_errors: int = 0                          # power requests the inverter refused
+        self._time_series = TimeSeries({ 'output': 'i4', 'target': STATIC }, static={ 'target': panel_id })
         
     def start(self):
         self._active = True
@@ -36,17 +38,10 @@ class CoolingSystem:
                 self._current_output = 0
             required_power = self._watts_per_degree * self._current_output
             self._power_source.get_power(self._id, required_power)     
-            self._time_series.append({
-                'index': len(self._time_series),
-                'output': self._current_output,
-                'target': panel_id
-            })
+            self._time_series.append(self._current_output)
             return self._current_output
-        except InsufficientPowerError:
-            self._time_series.append({
-                'index': len(self._time_series),
-                'output': 0,
-                'target': panel_id
-            })
+        except (InsufficientPowerError, LoadError):
+            self._load_errors += 1
+            self._time_series.append(0)
             return 0                                        # no air-conditioning for you
              
\ No newline at end of file
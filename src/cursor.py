@@ -0,0 +1,47 @@
+import base64
+import json
+
+
+class Cursor:
+    """A client's position in a PV system's history.
+
+    Panels, batteries and cooling systems record exactly one sample per tick, so a
+    position only needs the system's tick count; the inverter records a variable
+    number of samples per tick and is tracked separately. Cursors are issued to
+    clients as opaque tokens, so any number of clients can read the same system
+    without sharing state on the server.
+    """
+
+    def __init__(self, system_id: str, ticks: int = 0, inverter: int = 0):
+        self._system_id: str = system_id
+        self._ticks: int = ticks
+        self._inverter: int = inverter
+
+    @classmethod
+    def decode(cls, token: str, system_id: str):
+        """Rebuild a cursor from a token issued for system_id."""
+        try:
+            padding = '=' * (-len(token) % 4)
+            issued_for, ticks, inverter = json.loads(base64.urlsafe_b64decode(token + padding))
+        except Exception:
+            raise ValueError('INVALID_CURSOR')
+        if issued_for != system_id:
+            raise ValueError('INVALID_CURSOR')
+        return cls(system_id, ticks, inverter)
+
+    def encode(self) -> str:
+        """Return cursor as an opaque token."""
+        payload = json.dumps([self._system_id, self._ticks, self._inverter], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def offset(self, length: int, ticks: int) -> int:
+        """Return the first index of a per-tick series of length rows not yet seen, given the
+        current tick count."""
+        return max(0, length - (ticks - self._ticks))
+
+    @property
+    def ticks(self) -> int:
+        return self._ticks
+
+    def inverter_offset(self) -> int:
+        return self._inverter
@@ -1,31 +1,82 @@
 from simulator_types import Celcius, Watt
-from typing import List, Union
-from utils import uuid
+from typing import List, NamedTuple, Union
+from utils import uuid, random_seed, random_stream
 
+from clock import SimulationClock
 from datetime import datetime
+from weather import WeatherDataset
+
+import numpy as np
+
+
+class Conditions(NamedTuple):
+    """Immutable snapshot of environmental conditions at one point in simulated time."""
+    datetime: datetime
+    hour: int
+    minute: int
+    integer_time: int                  # hhmm, e.g. 1330
+    solar_irradiance: Watt
+    temperature: Celcius
 
 
 class Environment:
-    """Simulates environemt, overseeing the passage of time."""
+    """Simulates environemt, overseeing the passage of time.
+
+    The environment also owns the simulation's random stream. Every stochastic model
+    (output variance, heat loss) draws from it, so a run is reproducible from its seed.
+
+    Irradiance and temperature follow a fixed daily profile, or are read from a
+    recorded weather dataset when one is given.
+    """
     
-    def __init__(self):
-        """Initialise environment in 'frozen' state."""
+    def __init__(self, clock: SimulationClock = None, seed: int = None, weather: WeatherDataset = None):
+        """Initialise environment in 'frozen' state. Time only moves when the environment ticks.
+
+        seed: seed for the random stream. A fresh seed is drawn when omitted.
+        weather: recorded conditions, interpolated to the clock (see weather.open_dataset).
+        """
         self._id = uuid('ENVIRON')
+        self._clock: SimulationClock = clock or SimulationClock()
+        self._seed: int = random_seed() if seed is None else seed
+        self._random: np.random.Generator = random_stream(self._seed)
         self._datetime = ''
         self._active = True
         self._update_interval = 1
         self._min_solar_irradiance: Watt = 0
         self._max_solar_irradiance: Watt = 2000
         self._temperature: Celcius = 0
+        self._conditions: Conditions = None
         self._minumum_temperature: Celcius = 4
         self._maximum_temperature: Celcius = 35
-        # todo: factor in real time weather data based on location
+        self._weather: WeatherDataset = weather
+        self.set_time(self._clock.now)
         
     @property
     def current_time(self):
         """Time adapter function."""
         return str(self._datetime)
 
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def seed(self) -> int:
+        return self._seed
+
+    @property
+    def random(self) -> np.random.Generator:
+        return self._random
+
+    @property
+    def weather(self) -> WeatherDataset:
+        return self._weather
+
+    @property
+    def conditions(self) -> Conditions:
+        """Conditions at the current simulated time. Recomputed only when time changes."""
+        return self._conditions
+
     @property
     def max_solar_irradiance(self):
         return self._max_solar_irradiance
@@ -39,8 +90,11 @@ class Environment:
         self._active = False
     
     def solar_irradiance(self) -> Union[int, float]:
-        """Calculate current solar irradiance with respect to time."""
-        hour, minute = self._split_time(self._datetime)
+        """Return current solar irradiance."""
+        return self._conditions.solar_irradiance
+
+    def _solar_irradiance(self, hour: int, minute: int) -> Union[int, float]:
+        """Calculate solar irradiance with respect to time."""
         if hour < 6 or hour >= 18:                                # handle night time irradiance
             return self._min_solar_irradiance        
         if hour >= 12:                                            # invert all time values after 12
@@ -49,13 +103,35 @@ class Environment:
             time = hour + (minute / 60)
         return self._min_solar_irradiance + ((self._max_solar_irradiance - self._min_solar_irradiance) / 12) * (time - 6)
         
+    def can_tick(self, steps: int = 1) -> bool:
+        """Return whether conditions are known steps from now, i.e. the weather recording,
+        if any, continues that far."""
+        return self._weather is None or self._weather.covers(self._clock.peek(steps))
+
+    def tick(self, steps: int = 1):
+        """Advance the environment's clock and update time dependent conditions."""
+        self.set_time(self._clock.advance(steps))
+
     def set_time(self, simulated_time: datetime):
+        """Move to a new time and take a snapshot of the conditions at that time."""
         self._datetime = simulated_time
-        self._update_temperature()                                 # changes in time typically include temperature changes
+        hour, minute = self._split_time(simulated_time)
+        if self._weather is not None:
+            solar_irradiance, self._temperature = self._weather.at(simulated_time)
+        else:
+            self._update_temperature(hour, minute)                 # changes in time typically include temperature changes
+            solar_irradiance = self._solar_irradiance(hour, minute)
+        self._conditions = Conditions(
+            datetime=simulated_time,
+            hour=hour,
+            minute=minute,
+            integer_time=hour * 100 + minute,
+            solar_irradiance=solar_irradiance,
+            temperature=self._temperature
+        )
         
-    def _update_temperature(self) -> None:
+    def _update_temperature(self, hour: int, minute: int) -> None:
         """Update environment temperature based on time of day (typically by hour)."""
-        hour, minute = self._split_time(self._datetime)
         time = hour
         if hour >= 12:
             time = self._invert_time(hour, minute)
@@ -73,18 +149,15 @@ class Environment:
     def _split_time(self, date_time: datetime):                     # todo: move to utils
         """Helper function."""
         try:
-            hour, minute = date_time.strftime('%X')[:5].split(':')
-            return [int(hour), int(minute)]
-        except:
+            return [date_time.hour, date_time.minute]
+        except AttributeError:
             return [0, 0]
             
     def _integer_time(self, date_time: datetime, select_hour: bool = False) -> int:
         """Return time as an integer for mock solar irradiance calculations."""
         try:
-            limit = 2 if select_hour else 4
-            int_time = int(date_time.strftime('%X').replace(':', '')[:limit])
-            return int_time
-        except:
+            return date_time.hour if select_hour else date_time.hour * 100 + date_time.minute
+        except AttributeError:
             return 0
         
     def json(self):
@@ -0,0 +1,232 @@
+from typing import BinaryIO, Dict, List, Union
+
+from timeseries import TimeSeries
+
+import io
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+
+MAGIC = b'PVSX'
+VERSION = 1
+ALIGNMENT = 64                     # column blobs start on cache line boundaries so raw files map cleanly
+COMPRESSIONS = ('zlib', 'raw')
+
+_PREAMBLE = struct.Struct('<4sHI')   # magic, version, header length
+
+
+def _aligned(size: int) -> int:
+    """Round size up to a multiple of ALIGNMENT."""
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _series_columns(series_list: List[TimeSeries], lengths: List[int], labelled: bool) -> Dict[str, np.ndarray]:
+    """Concatenate the raw rows of several series with the same schema into columns.
+
+    lengths: rows of each series to read, as published in a snapshot; later rows are left out.
+    labelled: add a 'component' column holding each row's position in series_list.
+    """
+    fields = series_list[0].fields if series_list else []
+    starts, parts = [], []
+    for series, length in zip(series_list, lengths):
+        values = [series.column(field, series.first_index, length) for field in fields]
+        rows = min([len(column) for column in values])    # retention may fold rows between reads
+        starts.append(length - rows)
+        parts.append([column[len(column) - rows:] for column in values])
+    columns = {}
+    if labelled:
+        columns['component'] = np.concatenate([
+            np.full(length - start, position, dtype='i4')
+            for position, (start, length) in enumerate(zip(starts, lengths))
+        ] or [np.empty(0, dtype='i4')])
+    columns['index'] = np.concatenate([
+        np.arange(start, length, dtype='i8') for start, length in zip(starts, lengths)
+    ] or [np.empty(0, dtype='i8')])
+    for position, field in enumerate(fields):
+        columns[field] = np.concatenate([values[position] for values in parts])
+    return columns
+
+
+def _tables(system, snapshot) -> Dict[str, dict]:
+    """Return every history table of a system as { name: { 'components': ..., 'columns': ... } },
+    read up to the lengths published in snapshot."""
+    panels = [(panel, length, cooling_length) for panel, _, _, length, _, cooling_length in snapshot.panels]
+    batteries = [(battery, length) for battery, _, length in snapshot.batteries]
+    return {
+        'system': { 'components': None, 'columns': _series_columns([system._time_series], [snapshot.ticks], False) },
+        'panels': {
+            'components': [panel._time_series._static for panel, _, _ in panels],
+            'columns': _series_columns([panel._time_series for panel, _, _ in panels],
+                                       [length for _, length, _ in panels], True)
+        },
+        'batteries': {
+            'components': [battery._time_series._static for battery, _ in batteries],
+            'columns': _series_columns([battery._time_series for battery, _ in batteries],
+                                       [length for _, length in batteries], True)
+        },
+        'inverter': {
+            'components': None,
+            'columns': _series_columns([system._inverter._time_series], [snapshot.inverter], False)
+        },
+        'cooling': {
+            'components': [panel._cooling_system._time_series._static for panel, _, _ in panels],
+            'columns': _series_columns([panel._cooling_system._time_series for panel, _, _ in panels],
+                                       [length for _, _, length in panels], True)
+        }
+    }
+
+
+def write_export(system, target: Union[str, BinaryIO], compression: str = 'zlib'):
+    """Write a system's history as a columnar binary file.
+
+    Layout: a preamble (magic, version, header length), a json header describing the
+    system and the dtype, offset and size of every column, then the column blobs, each
+    aligned to ALIGNMENT bytes. Tables with several components (panels, batteries,
+    cooling) are stored long form with a 'component' column indexing the header's
+    component list. Only rows still held at full resolution are exported; rows folded
+    into rollups by a retention policy are not. Running systems are exported as of their
+    most recently published tick (see PhotoVoltaicSystem.snapshot), without taking
+    their lock.
+
+    target: file path or writable binary file.
+    compression: 'zlib' compresses each column, 'raw' allows readers to memory-map columns.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'UNKNOWN_COMPRESSION: {compression}')
+    snapshot = system.snapshot()
+    tables = _tables(system, snapshot)
+    blobs = []
+    header = { 'version': VERSION, 'compression': compression, 'system': system.json(snapshot), 'tables': {} }
+    for name, table in tables.items():
+        columns = []
+        for column, values in table['columns'].items():
+            blob = values.tobytes()
+            if compression == 'zlib':
+                blob = zlib.compress(blob, 6)
+            columns.append({
+                'name': column,
+                'dtype': values.dtype.str,
+                'rows': len(values),
+                'nbytes': len(blob)
+            })
+            blobs.append(blob)
+        header['tables'][name] = { 'components': table['components'], 'columns': columns }
+    position = 0                                     # offsets are relative to the aligned end of the header
+    for blob, column in zip(blobs, [column for table in header['tables'].values() for column in table['columns']]):
+        column['offset'] = position
+        position += _aligned(len(blob))
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    data_start = _aligned(_PREAMBLE.size + len(encoded))
+
+    def write(file: BinaryIO):
+        file.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+        file.write(encoded)
+        file.write(b'\0' * (data_start - _PREAMBLE.size - len(encoded)))
+        for blob in blobs:
+            file.write(blob)
+            file.write(b'\0' * (-len(blob) % ALIGNMENT))
+
+    if isinstance(target, str):
+        with open(target, 'wb') as file:
+            write(file)
+    else:
+        write(target)
+
+
+def export_bytes(system, compression: str = 'zlib') -> bytes:
+    """Return a system's history in the export format."""
+    buffer = io.BytesIO()
+    write_export(system, buffer, compression)
+    return buffer.getvalue()
+
+
+class ExportReader:
+    """Reads an export file by memory-mapping it.
+
+    Raw columns are returned as read-only views into the mapping, so opening a file and
+    selecting columns costs no copying; zlib columns are decompressed on first access.
+    Arrays taken from raw files are only valid until the reader is closed.
+    """
+
+    def __init__(self, source: Union[str, bytes]):
+        """Open an export.
+
+        source: file path, or the exported bytes themselves.
+        """
+        self._file = None
+        if isinstance(source, (bytes, bytearray)):
+            self._buffer = memoryview(source)
+        else:
+            self._file = open(source, 'rb')
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = _PREAMBLE.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('INVALID_EXPORT')
+        if version > VERSION:
+            raise ValueError(f'UNSUPPORTED_EXPORT_VERSION: {version}')
+        self._header: dict = json.loads(bytes(self._buffer[_PREAMBLE.size:_PREAMBLE.size + header_length]))
+        self._data_start: int = _aligned(_PREAMBLE.size + header_length)
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def header(self) -> dict:
+        return self._header
+
+    @property
+    def system(self) -> dict:
+        """System summary at export time."""
+        return self._header['system']
+
+    @property
+    def tables(self) -> List[str]:
+        return list(self._header['tables'].keys())
+
+    def components(self, table: str) -> List[dict]:
+        """Return static values (ids, capacities) of the components of a table, in 'component' order."""
+        return self._header['tables'][table]['components']
+
+    def column(self, table: str, name: str) -> np.ndarray:
+        """Return a single column."""
+        key = f'{table}.{name}'
+        if key not in self._columns:
+            columns = self._header['tables'][table]['columns']
+            description = next((column for column in columns if column['name'] == name), None)
+            if description is None:
+                raise KeyError(f'Unknown column: {key}')
+            start = self._data_start + description['offset']
+            dtype = np.dtype(description['dtype'])
+            if self._header['compression'] == 'zlib':
+                blob = zlib.decompress(self._buffer[start:start + description['nbytes']])
+                values = np.frombuffer(blob, dtype=dtype)
+            else:
+                values = np.frombuffer(self._buffer, dtype=dtype, count=description['rows'], offset=start)
+            self._columns[key] = values
+        return self._columns[key]
+
+    def table(self, table: str) -> Dict[str, np.ndarray]:
+        """Return every column of a table."""
+        return {
+            column['name']: self.column(table, column['name'])
+            for column in self._header['tables'][table]['columns']
+        }
+
+    def close(self):
+        """Release the mapping. Views returned for raw files must not be used afterwards."""
+        self._columns = {}
+        if self._file is not None:
+            try:
+                self._buffer.close()
+            except BufferError:                         # views still exported; released once collected
+                pass
+            self._file.close()
+            self._file = None
@@ -2,17 +2,27 @@ from simulator_types import Watt, Volt, Ampere
 from typing import List
 
 from battery import BatteryArray
+from timeseries import TimeSeries
 from utils import InsufficientPowerError
 
+import numpy as np
+
 class LoadError(Exception):
     """"""
     pass
 
 class Inverter:
-    """Converts DC power from the battery array to AC power."""
+    """Converts DC power from the battery array to AC power.
+
+    Appliances either request power one at a time through get_power, or, in settlement
+    mode, have all of a tick's requests resolved together through settle.
+    """
     
-    def __init__(self):
-        """Initialise a new inverter."""
+    def __init__(self, settlement: bool = False):
+        """Initialise a new inverter.
+
+        settlement: resolve each tick's requests in one pass, recording one sample per tick.
+        """
         self._max_output: Watt = 1500
         self._input_voltage: Volt = 0
         self._input_current: Ampere = 0
@@ -21,9 +31,13 @@ class Inverter:
         self._output_power: Watt = 0
         self._battery_array: BatteryArray = None
         self._load_error: bool = False
+        self._load_errors: int = 0
+        self._energy_delivered: Watt = 0                # running total of granted requests
         self._active: bool = False
         self._appliances: dict = {}
-        self._time_series: List[dict] = []
+        self._load: Watt = 0                            # running total of appliance outputs
+        self._settlement: bool = settlement
+        self._time_series = TimeSeries({ 'output': 'f8' })
         
     def start(self):
         """Start inverter."""
@@ -46,30 +60,66 @@ class Inverter:
     # ideally, all appliances should eventually request 0 watts of power.
     def get_power(self, appliance_id: str, power: Watt):
         """Get requested power, if available."""
-        self._output_power = self._get_total_output()
+        self._output_power = self._load
         requested_power = self._output_power + power
         if requested_power > self._max_output:
+            self._load_error = True
+            self._load_errors += 1
             raise LoadError('Requested power exceeds inverter specifications.')
         
         if self._battery_array._total_available_power > requested_power:
+            previous = self._appliances.get(appliance_id)
+            self._load += power - (previous['output'] if previous else 0)
             self._appliances[appliance_id] = { 'output': power }      # add or update appliance power requirements
             self._output_power = requested_power
-            state = { 'index': len(self._time_series), 'output': self._output_power }
-            self._time_series.append(state)
+            self._energy_delivered += power
+            self._time_series.append(self._output_power)
             return self._battery_array.discharge(power)
         
         # requested power is more than available power
-        state = { 'index': len(self._time_series), 'output': 0 }
-        self._time_series.append(state)
+        self._time_series.append(0)
         self._load_error = True
+        self._load_errors += 1
         raise InsufficientPowerError('Not enough power in batteries.')
     
-    def _get_total_output(self):
-        """Get current total power output across all appliances."""
-        return sum([
-            self._appliances[appliance]['output'] for appliance in self._appliances
-            if len(self._appliances) > 0
+    def settle(self, appliance_ids: List[str], powers: np.ndarray) -> np.ndarray:
+        """Resolve one tick's power requests in a single pass, return which were granted.
+
+        Requests are admitted in order while the running load stays within the inverter's
+        rating, below the battery array's available power and within what the array can
+        discharge at once; the first request that does not fit closes the budget for the
+        rest of the tick. Refused appliances are recorded as drawing nothing. Granted
+        power is discharged from the battery array in one call, and requests the array
+        did not supply are refused after all. The resulting load is recorded as a single
+        sample.
+        """
+        powers = np.asarray(powers, dtype=float)
+        previous = sum([
+            self._appliances[appliance_id]['output'] for appliance_id in appliance_ids
+            if appliance_id in self._appliances
         ])
-        
+        cumulative = (self._load - previous) + np.cumsum(powers)
+        granted = (cumulative <= self._max_output) & (cumulative < self._battery_array._total_available_power)
+        granted &= np.cumsum(powers) <= self._battery_array.discharge_limit()   # only this tick's requests are drawn
+        delivered = np.where(granted, powers, 0.0)
+        total = float(delivered.sum())
+        if total > 0:
+            supplied = self._battery_array.discharge(total)
+            if supplied < total:                        # a battery refused its share at the limit
+                granted &= np.cumsum(delivered) <= supplied
+                delivered = np.where(granted, powers, 0.0)
+                total = float(delivered.sum())
+        self._appliances.update({
+            appliance_id: { 'output': output } for appliance_id, output in zip(appliance_ids, delivered.tolist())
+        })
+        refused = len(powers) - int(granted.sum())
+        self._load += total - previous
+        self._output_power = self._load
+        self._energy_delivered += total
+        self._load_error = refused > 0
+        self._load_errors += refused
+        self._time_series.append(self._output_power)
+        return granted
+
     def _convert_to_ac(self):
         """"""
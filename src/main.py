@@ -1,21 +1,35 @@
-from typing import List, Union
+from typing import Callable, Dict, List, Union
 from typing_extensions import TypedDict
 
+from checkpoint import CheckpointStore
+from clock import SimulationClock, DEFAULT_START_TIME
+from cursor import Cursor
 from environment import Environment
+from export import export_bytes
 from pv_system import PhotoVoltaicSystem
+from registry import SimulationRegistry
+from response_cache import ResponseCache, etag_matches
+from scheduler import default_scheduler
+from timeseries import RetentionPolicy
+from sweep import run_sweep
+from utils import uuids
+from weather import WeatherLibrary
 from solar_panel import SolarPanel, SolarArray
 from battery import Battery, BatteryArray
 
 from datetime import datetime
-from freezegun import freeze_time
 
-import time
-import threading
 import fastapi
 
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.websockets import WebSocketDisconnect
 
-environment = Environment()
+import asyncio
+import json
+import metrics
+import os
 
 app = fastapi.FastAPI()
 
@@ -27,7 +41,35 @@ app.add_middleware(
     allow_headers=['*']
 )
 
-ACTIVE_SIMULATIONS: List[PhotoVoltaicSystem] = []
+# set PV_CHECKPOINT_DIR to an empty string to keep simulations in memory only
+CHECKPOINT_DIR = os.environ.get('PV_CHECKPOINT_DIR', 'checkpoints')
+CHECKPOINTS = CheckpointStore(CHECKPOINT_DIR) if CHECKPOINT_DIR else None
+
+# set PV_METRICS=0 to turn instrumentation off; /metrics then responds 404
+if os.environ.get('PV_METRICS', '1') == '0':
+    metrics.disable()
+
+SIMULATIONS = SimulationRegistry(
+    idle_seconds=60 * 60,                          # stopped and unread for an hour
+    finished_seconds=60 * 10,                      # finished and unread for ten minutes
+    max_resident=None,
+    store=CHECKPOINTS,                             # evicted and pre-restart systems are restored on first use
+    max_archive_bytes=int(os.environ.get('PV_ARCHIVE_BYTES', 64 * 1024 * 1024))    # without a store
+)
+
+if CHECKPOINTS is not None:
+    CHECKPOINTS.start(SIMULATIONS, interval=30)
+
+# recorded weather, one <site>.pvw file per site (see weather.py for the csv converter)
+WEATHER_DIR = os.environ.get('PV_WEATHER_DIR', 'weather')
+WEATHER = WeatherLibrary(WEATHER_DIR)
+
+# async read endpoints build responses of up to this many history rows on the event loop,
+# larger ones on the threadpool
+INLINE_ROWS = 512
+
+# serialised read responses, shared between clients until the system ticks or is reconfigured
+RESPONSES = ResponseCache(int(os.environ.get('PV_RESPONSE_CACHE_BYTES', 64 * 1024 * 1024)))
 
 
 class temperatureDict(TypedDict):
@@ -69,34 +111,111 @@ class IncomingIterations(TypedDict):
     system_id: str
     value: int
 
-@freeze_time('May 21, 2024 04:00', auto_tick_seconds=300)
-def simulated_time(environment: Environment):
-    """Updates an environment's time value based on specified interval."""
-    while environment._active:
-        environment.set_time(datetime.now())
-        time.sleep(1)
+class IncomingSweep(TypedDict):
+    base: dict
+    grid: Dict[str, list]
 
-sim_time_thread = threading.Thread(target=simulated_time, args=(environment,))
-sim_time_thread.start()
+class PanelSpec(TypedDict):
+    stc: IncomingSTC
+    temp_coefficient: Union[int, float]
+    area: Union[int, float]
+
+class BatterySpec(TypedDict):
+    volts: Union[int, float]
+    amps: int
+
+class IncomingPanelBatch(TypedDict, total=False):
+    system_id: str
+    panels: List[PanelSpec]                        # either a list of specs...
+    spec: PanelSpec                                # ...or one spec repeated count times
+    count: int
+
+class IncomingBatteryBatch(TypedDict, total=False):
+    system_id: str
+    batteries: List[BatterySpec]
+    spec: BatterySpec
+    count: int
+
+class IncomingRemoval(TypedDict):
+    system_id: str
+    ids: List[str]
 
 def get_pv_system(system_id: str):
     """Get PhotoVoltaicSystem by _id."""
-    for system in ACTIVE_SIMULATIONS:
-        if system._id == system_id:
-            return system
-    raise ValueError('PVS_NOT_FOUND')
+    return SIMULATIONS.get(system_id)
+
+async def read_pv_system(system_id: str) -> PhotoVoltaicSystem:
+    """get_pv_system for async endpoints. Resident systems are returned directly; restoring
+    one from its checkpoint reads from disk, so happens on the threadpool."""
+    system = SIMULATIONS.resident(system_id)
+    if system is None:
+        system = await run_in_threadpool(get_pv_system, system_id)
+    return system
+
+def expected_rows(system: PhotoVoltaicSystem, target_data: str, position: Cursor = None) -> int:
+    """Estimate the history rows a read of target_data returns."""
+    snapshot = system.snapshot()
+    if target_data == 'inverter':
+        return snapshot.inverter - (position.inverter_offset() if position else 0)
+    components = {
+        'panels': len(snapshot.panels),
+        'cooling': len(snapshot.panels),
+        'batteries': len(snapshot.batteries)
+    }.get(target_data, 1)
+    return (snapshot.ticks - (position.ticks if position else 0)) * components
+
+async def cached_response(request: fastapi.Request, system: PhotoVoltaicSystem, endpoint: str, params: tuple,
+                          build, rows: Callable[[], int] = None) -> Response:
+    """Respond with build() serialised as json, reusing the cached response while the
+    system's version is unchanged. Answers a matching If-None-Match with 304.
+
+    rows: counts the history rows build() returns. Only called on a miss, to decide
+    whether to build off the event loop; small responses omit it.
+    """
+    key = (system._id, endpoint, params)
+    version = system.version                                  # read before building so a tick mid-build only causes a rebuild
+    entry = RESPONSES.get(key, version)
+    if entry is None:
+        def render():
+            return RESPONSES.put(key, version, json.dumps(build()).encode())
+        entry = await run_in_threadpool(render) if rows and rows() > INLINE_ROWS else render()
+    etag, content = entry
+    headers = { 'ETag': etag, 'Cache-Control': 'no-cache' }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type='application/json', headers=headers)
 
 @app.get('/pv/init')
-def create_env():
+def create_env(start_time: datetime = None, step_seconds: int = 300, seed: int = None,
+               settlement: bool = False, connection_type: str = 'series', site: str = None):
+    """Initialise a new simulation with its own environment, clock and random seed.
+
+    settlement: settle cooling power requests once per tick rather than one at a time.
+    connection_type: 'series' or 'parallel' wiring of the battery array.
+    site: simulate against the site's recorded weather (see /pv/weather). start_time
+        then defaults to the start of the recording.
+    """
+    try:
+        weather = WEATHER.dataset(site) if site else None
+        start_time = start_time or (weather.start if weather else DEFAULT_START_TIME)
+        environment = Environment(SimulationClock(start_time, step_seconds), seed, weather)
+    except ValueError as e:
+        return { 'error': str(e) }
     solar_array = SolarArray()                     # create empty solar array
-    battery_array = BatteryArray()                 # create empty battery array
-    system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array)
-    ACTIVE_SIMULATIONS.append(system)
+    try:
+        battery_array = BatteryArray(connection_type)  # create empty battery array
+    except ValueError as e:
+        return { 'error': str(e) }
+    system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array,
+                                settlement=settlement)
+    system.set_retention(RetentionPolicy(environment.clock))
+    SIMULATIONS.add(system)
     return { 'result': system.json() }
 
 @app.get('/pv/init/default')
-def create_default_sim():
+def create_default_sim(seed: int = None):
     """Initialise and start default simulation."""
+    environment = Environment(seed=seed)
     solar_array = SolarArray()
     battery_array = BatteryArray()
     panels = [SolarPanel({
@@ -116,40 +235,177 @@ def create_default_sim():
     [solar_array.add(panel) for panel in panels]
     [battery_array.add(battery) for battery in batteries]
     system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array)
-    ACTIVE_SIMULATIONS.append(system)
+    system.set_retention(RetentionPolicy(environment.clock))
+    SIMULATIONS.add(system)
     system.start()
     return { 'result': system.json() }
 
 # todo: switch back to get, system id to query param
 @app.put('/pv/system')   # method changed from get to put to support request body
-def pv_system(data: SystemDetails):
+async def pv_system(data: SystemDetails, request: fastapi.Request):
     """Get PV system by _id."""
     try:
-        return { 'result': get_pv_system(data['system_id']).json() }
+        system = await read_pv_system(data['system_id'])
+        return await cached_response(request, system, 'system', (), lambda: { 'result': system.json() })
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.delete('/pv/system')
+def delete_pv_system(system_id: str):
+    """Stop and delete a PV system."""
+    try:
+        RESPONSES.invalidate(system_id)
+        return SIMULATIONS.remove(system_id)
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.get('/pv/system/archive')
+def archived_pv_system(system_id: str):
+    """Get the archived summary and history of an evicted PV system."""
+    try:
+        return { 'result': SIMULATIONS.archived(system_id) }
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.get('/pv/system/export')
+def export_pv_system(system_id: str, compression: str = 'zlib'):
+    """Download a system's full history as a columnar binary file (see export.write_export)."""
+    try:
+        content = export_bytes(get_pv_system(system_id), compression)
+    except Exception as e:
+        return { 'error': str(e) }
+    return Response(
+        content=content,
+        media_type='application/octet-stream',
+        headers={ 'Content-Disposition': f'attachment; filename="{system_id}.pvsx"' }
+    )
+
+@app.put('/pv/system/checkpoint')
+def checkpoint_pv_system(data: SystemDetails):
+    """Checkpoint a PV system now rather than at the next periodic checkpoint."""
+    try:
+        if CHECKPOINTS is None:
+            raise ValueError('CHECKPOINTS_DISABLED')
+        CHECKPOINTS.save(get_pv_system(data['system_id']), SIMULATIONS)
+        return { 'result': 'SUCCESS' }
     except Exception as e:
         return { 'error': str(e) }
 
+@app.get('/pv/checkpoints')
+def checkpoints():
+    """List checkpointed systems. Any of them can be used directly; they are restored on first access."""
+    if CHECKPOINTS is None:
+        return { 'error': 'CHECKPOINTS_DISABLED' }
+    return { 'result': { **CHECKPOINTS.json(), 'system_ids': CHECKPOINTS.system_ids() } }
+
+@app.get('/metrics')
+def metrics_endpoint():
+    """Tick latency histograms, tick lag, system counts and memory in the Prometheus text format."""
+    if not metrics.ENABLED:
+        return PlainTextResponse('metrics disabled\n', status_code=404)
+    return PlainTextResponse(metrics.render(SIMULATIONS, default_scheduler(), RESPONSES),
+                             media_type='text/plain; version=0.0.4')
+
+@app.get('/pv/weather')
+def weather_sites():
+    """List sites with recorded weather, and the period each covers."""
+    try:
+        return { 'result': [WEATHER.dataset(site).json() for site in WEATHER.sites()] }
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.get('/pv/registry')
+def registry_status():
+    """Get resident, running and archived system counts."""
+    return { 'result': SIMULATIONS.json() }
+
+def read_system_data(system: PhotoVoltaicSystem, target_data: str, cursor: str = None,
+                     position: Cursor = None) -> dict:
+    """Build a /pv/system/data response."""
+    next_cursor = system.cursor().encode()                    # issued before reading so no rows are missed
+    if target_data == 'system':
+        result = system.system_data(position)
+    elif target_data == 'panels':
+        result = system.panel_data(position)
+    elif target_data == 'batteries':
+        result = system.battery_data(position)
+    elif target_data == 'inverter':
+        result = system.inverter_data(position)
+    elif target_data =='cooling':
+        result = system.cooling_data(position)
+    elif target_data == 'iter':
+        result = system.get_iterations()
+    else:
+        result = system.json()
+    if cursor is None:
+        return { 'result': result }
+    return { 'result': result, 'cursor': next_cursor }
+
 @app.get('/pv/system/data')
-def system_data(system_id: str, target_data: str):
-    """Get system time series."""
+async def system_data(request: fastapi.Request, system_id: str, target_data: str, cursor: str = None):
+    """Get system time series.
+
+    Pass cursor (empty on the first request) to receive only rows added since the
+    cursor was issued, along with a new cursor for the next request.
+    """
     try:
-        if target_data == 'system':
-            return { 'result': get_pv_system(system_id).system_data() }
-        elif target_data == 'panels':
-            return { 'result': get_pv_system(system_id).panel_data() }
-        elif target_data == 'batteries':
-            return { 'result': get_pv_system(system_id).battery_data() }
-        elif target_data == 'inverter':
-            return { 'result': get_pv_system(system_id).inverter_data() }
-        elif target_data =='cooling':
-            return { 'result': get_pv_system(system_id).cooling_data() }
-        elif target_data == 'iter':
-            return { 'result': get_pv_system(system_id).get_iterations() }
-        else:
-            return { 'result': get_pv_system(system_id).json() }
+        system = await read_pv_system(system_id)
+        position = Cursor.decode(cursor, system._id) if cursor else None
+        return await cached_response(
+            request,
+            system,
+            'data',
+            (target_data, cursor),
+            lambda: read_system_data(system, target_data, cursor, position),
+            lambda: expected_rows(system, target_data, position)
+        )
     except Exception as e:
         return { 'error': str(e) } 
 
+def subscribe(system_id: str, channels: str):
+    """Subscribe to a system's tick stream. channels is a comma separated list."""
+    system: PhotoVoltaicSystem = get_pv_system(system_id)
+    selected = [channel.strip() for channel in channels.split(',') if channel.strip()]
+    return system._broadcaster, system._broadcaster.subscribe(selected, asyncio.get_running_loop())
+
+@app.get('/pv/stream')
+async def stream_system(system_id: str, channels: str = 'system'):
+    """Stream ticks as server-sent events."""
+    try:
+        broadcaster, subscription = subscribe(system_id, channels)
+    except Exception as e:
+        return { 'error': str(e) }
+
+    async def events():
+        try:
+            while not subscription.closed:
+                for channel, frame in await subscription.get():
+                    yield f'event: {channel}\ndata: {frame}\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+@app.websocket('/pv/ws')
+async def stream_system_ws(websocket: fastapi.WebSocket, system_id: str, channels: str = 'system'):
+    """Stream ticks over a websocket."""
+    await websocket.accept()
+    try:
+        broadcaster, subscription = subscribe(system_id, channels)
+    except Exception as e:
+        await websocket.send_json({ 'error': str(e) })
+        await websocket.close()
+        return
+    try:
+        while not subscription.closed:
+            for _, frame in await subscription.get():
+                await websocket.send_text(frame)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscription)
+
 @app.put('/pv/system/iterations')
 def pv_iterations(data: IncomingIterations):
     try:
@@ -169,6 +425,23 @@ def start_pv_system(system_id: str):
     except Exception as e:
         return { 'error': str(e) }
     
+@app.get('/pv/run')
+def run_pv_system(system_id: str):
+    """Run target PV system to completion without real time delays."""
+    try:
+        system: PhotoVoltaicSystem = get_pv_system(system_id)
+        return { 'result': system.fast_forward() }
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.put('/pv/sweep')
+def sweep_pv_systems(data: IncomingSweep):
+    """Run every combination of grid parameters against a base configuration."""
+    try:
+        return { 'result': run_sweep(data['base'], data['grid'], weather_directory=WEATHER_DIR) }
+    except Exception as e:
+        return { 'error': str(e) }
+
 @app.get('/pv/stop')
 def stop_pv_system(system_id: str):
     """Stop target PV system."""
@@ -179,6 +452,11 @@ def stop_pv_system(system_id: str):
     except Exception as e:
         return { 'error': str(e) }
 
+@app.get('/pv/scheduler')
+def scheduler_status():
+    """Get tick scheduler queue depth, lag and throughput."""
+    return { 'result': default_scheduler().json() }
+
 @app.get('/pv/panel')
 def get_panel(system_id: str, panel_id: str):
     """Get panel data."""
@@ -190,11 +468,14 @@ def get_panel(system_id: str, panel_id: str):
         return { 'error': str(e) }
 
 @app.get('/pv/panels')
-def get_panels(system_id: str):
+async def get_panels(request: fastapi.Request, system_id: str):
     """Get panels connected to a specified pv system."""
     try:
-        system: PhotoVoltaicSystem = get_pv_system(system_id)
-        return { 'result': [panel.json() for panel in system._panels] }
+        system = await read_pv_system(system_id)
+        return await cached_response(
+            request, system, 'panels', (), lambda: { 'result': system.panels_json() },
+            lambda: expected_rows(system, 'panels')
+        )
     except Exception as e:
         return { 'error': str(e) }
 
@@ -216,21 +497,62 @@ def add_panel(data: IncomingSolarPanel):
             'temp_coefficient': data['temp_coefficient'],
             'area': data['area']
         })
-        if system._metadata:
-            system._metadata['panels'][panel._id] = 0             # update metadata
-            system._metadata['cooling_systems'][panel._id] = 0
-        system._panels.add(panel)
-        system.connect_panel_cooling(panel._id)
+        system.add_panels([panel])                                # wires cooling and updates metadata
         return { 'result': 'SUCCESS' }
     except Exception as e:
         return { 'error': str(e) }
 
+def batch_specs(data: dict, key: str) -> list:
+    """Return the specs of a batch request, given as a list or as spec and count."""
+    if key in data:
+        return data[key]
+    if 'spec' in data and 'count' in data:
+        return [data['spec']] * data['count']
+    raise ValueError(f'Provide either {key} or spec and count.')
+
+@app.put('/pv/panels/add')
+def add_panels(data: IncomingPanelBatch):
+    """Add many panels to a solar array in one operation."""
+    try:
+        system: PhotoVoltaicSystem = get_pv_system(data['system_id'])
+        specs = batch_specs(data, 'panels')
+        panel_ids = uuids('PANEL', len(specs))
+        cooling_ids = uuids('COOLING', len(specs))
+        panels = [
+            SolarPanel({
+                'panel_id': panel_id,
+                'cooling_id': cooling_id,
+                'environment': system._environment,
+                'standard_conditions': spec['stc'],
+                'temp_coefficient': spec['temp_coefficient'],
+                'area': spec['area']
+            })
+            for spec, panel_id, cooling_id in zip(specs, panel_ids, cooling_ids)
+        ]
+        system.add_panels(panels)
+        return { 'result': panel_ids }
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.delete('/pv/panels/remove')
+def remove_panels(data: IncomingRemoval):
+    """Remove many panels from a solar array in one operation."""
+    try:
+        system: PhotoVoltaicSystem = get_pv_system(data['system_id'])
+        result = system._panels.remove_many(data['ids'])
+        system.reconfigured()
+        return result
+    except Exception as e:
+        return { 'error': str(e) }
+
 @app.delete('/pv/panel/remove')
 def remove_panel(system_id: str, panel_id: str):
     """Remove panel from target PV system."""
     try:
         system: PhotoVoltaicSystem = get_pv_system(system_id)
-        return system._panels.remove(panel_id)
+        result = system._panels.remove(panel_id)
+        system.reconfigured()
+        return result
     except Exception as e:
         return { 'error': str(e) }    
 
@@ -264,16 +586,46 @@ def add_battery(data: IncomingBattery):
             system._metadata['batteries'][battery._id] = 0
             print('post battery meta:', system._metadata)
         system._batteries.add(battery)
+        system.reconfigured()
         return { 'result': 'SUCCESS' }
     except Exception as e:
         return { 'error': str(e) }
 
+@app.put('/pv/batteries/add')
+def add_batteries(data: IncomingBatteryBatch):
+    """Add many batteries to a battery array in one operation."""
+    try:
+        system: PhotoVoltaicSystem = get_pv_system(data['system_id'])
+        specs = batch_specs(data, 'batteries')
+        battery_ids = uuids('BATTERY', len(specs))
+        batteries = [
+            Battery(volts=spec['volts'], amps=spec['amps'], battery_id=battery_id)
+            for spec, battery_id in zip(specs, battery_ids)
+        ]
+        system.add_batteries(batteries)
+        return { 'result': battery_ids }
+    except Exception as e:
+        return { 'error': str(e) }
+
+@app.delete('/pv/batteries/remove')
+def remove_batteries(data: IncomingRemoval):
+    """Remove many batteries from a battery array in one operation."""
+    try:
+        system: PhotoVoltaicSystem = get_pv_system(data['system_id'])
+        result = system._batteries.remove_many(data['ids'])
+        system.reconfigured()
+        return result
+    except Exception as e:
+        return { 'error': str(e) }
+
 @app.delete('/pv/battery/remove')
 def remove_battery(system_id: str, battery_id: str):
     """Add battery to target PV system."""
     try:
         system: PhotoVoltaicSystem = get_pv_system(system_id)
-        return system._batteries.remove(battery_id)
+        result = system._batteries.remove(battery_id)
+        system.reconfigured()
+        return result
     except Exception as e:
         return { 'error': str(e) }
 
@@ -0,0 +1,154 @@
+from typing import Dict, List, Tuple
+
+from bisect import bisect_left
+
+import threading
+import time
+
+
+# Instrumentation is checked against this flag before any clock is read, so a disabled
+# server pays one global lookup per instrumented stage. Toggle with enable()/disable().
+ENABLED: bool = True
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5
+)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+class Histogram:
+    """Cumulative latency histogram with one label, in the Prometheus exposition format."""
+
+    def __init__(self, name: str, help: str, label: str = None, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._name: str = name
+        self._help: str = help
+        self._label: str = label
+        self._buckets: Tuple[float, ...] = buckets
+        self._series: Dict[str, list] = {}              # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label: str = None):
+        """Record an observation, in seconds."""
+        position = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self._buckets) + 1) + [0.0, 0]
+            series[position] += 1                       # position len(buckets) is the +Inf bucket
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        """Return exposition lines."""
+        lines = [f'# HELP {self._name} {self._help}', f'# TYPE {self._name} histogram']
+        with self._lock:
+            snapshot = { label: list(series) for label, series in self._series.items() }
+        for label, series in snapshot.items():
+            prefix = f'{self._label}="{label}",' if self._label else ''
+            labels = f'{{{prefix[:-1]}}}' if prefix else ''
+            cumulative = 0
+            for bound, count in zip([*self._buckets, '+Inf'], series[:-2]):
+                cumulative += count
+                lines.append(f'{self._name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self._name}_sum{labels} {series[-2]}')
+            lines.append(f'{self._name}_count{labels} {series[-1]}')
+        return lines
+
+
+TICK_SECONDS = Histogram('pv_tick_seconds', 'Wall clock duration of a whole system tick.')
+STAGE_SECONDS = Histogram(
+    'pv_tick_stage_seconds',
+    'Wall clock duration of tick stages. The panels stage includes cooling and panel_series_append.',
+    label='stage'
+)
+TICK_LAG_SECONDS = Histogram('pv_tick_lag_seconds', 'Delay between a tick falling due and it starting.')
+
+
+class TickTimer:
+    """Times consecutive stages of one tick. Create through tick_timer()."""
+
+    __slots__ = ('_started', '_last')
+
+    def __init__(self):
+        self._started = self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        """Record time since the previous lap as stage."""
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - self._last, stage)
+        self._last = now
+
+    def stop(self):
+        """Record the duration of the whole tick."""
+        TICK_SECONDS.observe(time.perf_counter() - self._started)
+
+
+def tick_timer() -> TickTimer:
+    """Return a timer for a tick, or None while metrics are disabled."""
+    return TickTimer() if ENABLED else None
+
+
+def _gauge(name: str, help: str, value, kind: str = 'gauge') -> List[str]:
+    return [f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}']
+
+
+def _cache_gauges(cache) -> List[str]:
+    if cache is None:
+        return []
+    stats = cache.json()
+    return [
+        *_gauge('pv_response_cache_bytes', 'Bytes held by the response cache.', stats['bytes']),
+        *_gauge('pv_response_cache_entries', 'Responses held by the response cache.', stats['entries']),
+        *_gauge('pv_response_cache_hits_total', 'Reads served from the response cache.', stats['hits'], 'counter'),
+        *_gauge('pv_response_cache_misses_total', 'Reads that built a response.', stats['misses'], 'counter'),
+        *_gauge('pv_response_cache_evictions_total', 'Responses evicted to stay within the memory bound.',
+                stats['evictions'], 'counter')
+    ]
+
+
+def render(registry, scheduler, cache=None) -> str:
+    """Return every metric in the Prometheus text exposition format.
+
+    Gauges describing resident systems are computed here, at scrape time, rather than
+    maintained on the tick path. Totals over resident systems fall when a system is
+    removed or evicted, so they are gauges, not counters.
+    """
+    systems = list(registry)
+    scheduler_stats = scheduler.json()
+    series_bytes = 0
+    inverter_requests = 0
+    inverter_load_errors = 0
+    cooling_load_errors = 0
+    for system in systems:
+        series_bytes += sum([series.nbytes for series in system.time_series().values()])
+        inverter_requests += len(system._inverter._time_series)
+        inverter_load_errors += system._inverter._load_errors
+        cooling_load_errors += sum([panel._cooling_system._load_errors for panel in system._panels])
+    lines = [
+        *_gauge('pv_systems_resident', 'PV systems held in memory.', len(systems)),
+        *_gauge('pv_systems_active', 'PV systems currently running.', len([system for system in systems if system._active])),
+        *_gauge('pv_time_series_bytes', 'Bytes allocated for time series columns of resident systems.', series_bytes),
+        *_gauge('pv_scheduler_queue_depth', 'Systems waiting for their next tick.', scheduler_stats['queue_depth']),
+        *_gauge('pv_scheduler_running', 'Ticks in flight.', scheduler_stats['running']),
+        *_gauge('pv_scheduler_tick_lag_seconds', 'Lag of the most recent scheduled tick.', scheduler_stats['tick_lag']),
+        *_gauge('pv_scheduler_ticks_total', 'Ticks run by the scheduler.', scheduler_stats['ticks'], 'counter'),
+        *_gauge('pv_scheduler_errors_total', 'Ticks that raised.', scheduler_stats['errors'], 'counter'),
+        *_gauge('pv_inverter_requests', 'Inverter power requests held by resident systems.', inverter_requests),
+        *_gauge('pv_inverter_load_errors', 'Inverter requests refused by resident systems.', inverter_load_errors),
+        *_gauge('pv_cooling_load_errors', 'Cooling requests refused by resident systems.', cooling_load_errors),
+        *_cache_gauges(cache),
+        *TICK_SECONDS.render(),
+        *STAGE_SECONDS.render(),
+        *TICK_LAG_SECONDS.render()
+    ]
+    return '\n'.join(lines) + '\n'
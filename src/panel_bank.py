@@ -0,0 +1,169 @@
+import numpy as np
+
+from typing import List, Tuple
+from utils import batch_variation
+
+import metrics
+import time
+
+
+class PanelBank:
+    """Array-backed model of a solar array. Computes a tick for every panel in one pass.
+
+    Panel parameters and state are held as parallel arrays, one slot per panel, in the
+    same order as the owning array's panels. Panels can be added and swap-removed
+    without rebuilding the bank. Results are written back to the panel
+    objects after each tick so the per-panel api (status, json, time series) is unchanged.
+    """
+
+    def __init__(self, panels: List['SolarPanel']):
+        """Build bank from existing panels, taking over their current state."""
+        self._panels = list(panels)
+        self._environment = self._panels[0]._environment if self._panels else None
+        rows = [self._row(panel) for panel in self._panels]
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.array([row[name] for row in rows], dtype=dtype))
+
+    _COLUMNS = {
+        '_power_rating': float,
+        '_efficiency': float,
+        '_temperature_coefficient': float,
+        '_optimal_temperature': float,
+        '_area': float,
+        '_current_temperature': float,
+        '_current_output': float,
+        '_cooling_output': int,
+        '_cooling_max_output': int,
+        '_cooling_watts_per_degree': float,
+        '_cooling_active': bool
+    }
+
+    @staticmethod
+    def _row(panel: 'SolarPanel') -> dict:
+        """Return a panel's values for every bank column."""
+        return {
+            '_power_rating': panel._power_rating,
+            '_efficiency': panel._efficiency,
+            '_temperature_coefficient': panel._temperature_coefficient,
+            '_optimal_temperature': panel._optimal_temperature,
+            '_area': panel._area,
+            '_current_temperature': panel._current_temperature,
+            '_current_output': panel._current_output,
+            '_cooling_output': panel._cooling_system._current_output,
+            '_cooling_max_output': panel._cooling_system._max_output,
+            '_cooling_watts_per_degree': panel._cooling_system._watts_per_degree,
+            '_cooling_active': panel._cooling_system._active
+        }
+
+    def add(self, panel: 'SolarPanel'):
+        """Append a panel in the last slot."""
+        if self._environment is None:
+            self._environment = panel._environment
+        self._panels.append(panel)
+        row = self._row(panel)
+        for name in self._COLUMNS:
+            setattr(self, name, np.append(getattr(self, name), row[name]))
+
+    def extend(self, panels: List['SolarPanel']):
+        """Append several panels, growing every column once."""
+        if self._environment is None and panels:
+            self._environment = panels[0]._environment
+        self._panels.extend(panels)
+        rows = [self._row(panel) for panel in panels]
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.concatenate([getattr(self, name), np.array([row[name] for row in rows], dtype=dtype)]))
+
+    def refresh(self, slot: int):
+        """Re-read a panel's settings and state into its slot."""
+        row = self._row(self._panels[slot])
+        for name in self._COLUMNS:
+            getattr(self, name)[slot] = row[name]
+
+    def remove(self, slot: int):
+        """Remove the panel in slot by moving the last panel into its place."""
+        last = len(self._panels) - 1
+        self._panels[slot] = self._panels[last]
+        self._panels.pop()
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            column[slot] = column[last]
+            setattr(self, name, column[:last])
+
+    def __len__(self):
+        return len(self._panels)
+
+    def tick(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Advance every panel by one tick, return (power outputs, panel temperatures)."""
+        conditions = self._environment.conditions
+        cooling_factors = self._cooling_factors()
+        self._current_temperature = conditions.temperature - cooling_factors
+        efficiency = self._calculate_efficiency()
+        solar_irradiance = conditions.solar_irradiance * self._area
+        self._current_output = batch_variation((solar_irradiance * efficiency) / 3, rng=self._environment.random)
+        started = time.perf_counter() if metrics.ENABLED else None
+        self._write_back()
+        if started is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'panel_series_append')
+        return self._current_output, self._current_temperature
+
+    def _calculate_efficiency(self) -> np.ndarray:
+        """Vectorised SolarPanel._calculate_efficiency."""
+        degrees_above_threshold = self._current_temperature - self._optimal_temperature
+        return np.where(
+            degrees_above_threshold > 0,
+            self._efficiency - (self._temperature_coefficient * degrees_above_threshold),
+            self._efficiency
+        )
+
+    def _cooling_factors(self) -> np.ndarray:
+        """Vectorised SolarPanel._cooling_factors."""
+        temperature_difference = self._current_temperature - self._optimal_temperature
+        cooling = (temperature_difference > 0) & self._cooling_active
+        below_target = self._cooling_output < temperature_difference
+        self._cooling_output += cooling & below_target & (self._cooling_output < self._cooling_max_output)
+        self._cooling_output -= cooling & ~below_target & (self._cooling_output > 0)
+        self._cooling_output[~cooling] = 0   # idle cooling systems are reset
+        started = time.perf_counter() if metrics.ENABLED else None
+        delivered = self._yield_cooling(cooling)
+        if started is not None:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'cooling')
+        heat_loss = self._environment.random.uniform(0, 3, len(self._panels))
+        return np.where(cooling, delivered, heat_loss)
+
+    def _yield_cooling(self, cooling: np.ndarray) -> np.ndarray:
+        """Request cooling power for every panel. Inverter requests are stateful, so they
+        are made one panel at a time, in panel order, unless the inverter settles a
+        tick's requests in one pass."""
+        inverter = self._panels[0]._cooling_system._power_source if self._panels else None
+        if inverter is not None and inverter._settlement:
+            return self._settle_cooling(inverter, cooling)
+        delivered = np.zeros(len(self._panels))
+        for slot, (panel, output, active) in enumerate(
+                zip(self._panels, self._cooling_output.tolist(), cooling.tolist())):
+            panel._cooling_system._current_output = output
+            delivered[slot] = panel._cooling_system.yield_(panel._id, reset=not active)
+        return delivered
+
+    def _settle_cooling(self, inverter, cooling: np.ndarray) -> np.ndarray:
+        """Vectorised CoolingSystem.yield_ for an inverter in settlement mode."""
+        outputs = np.where(cooling, self._cooling_output, 0)
+        granted = inverter.settle(
+            [panel._cooling_system._id for panel in self._panels],
+            outputs * self._cooling_watts_per_degree
+        )
+        delivered = np.where(granted, outputs, 0)
+        for panel, output, recorded, ok in zip(self._panels, outputs.tolist(), delivered.tolist(), granted.tolist()):
+            cooling_system = panel._cooling_system
+            cooling_system._current_output = output
+            cooling_system._time_series.append(recorded)
+            if not ok:
+                cooling_system._load_errors += 1
+        return delivered
+
+    def _write_back(self):
+        """Copy tick results back onto panel objects and their time series."""
+        for panel, output, temperature in zip(self._panels, self._current_output.tolist(),
+                                              self._current_temperature.tolist()):
+            panel._current_output = output
+            panel._current_temperature = temperature
+            panel._time_series.append(output, temperature)
@@ -1,193 +1,403 @@
-from typing import List
+from typing import Dict, List
 from simulator_types import Watt, Volt
 from utils import uuid, PhotoVoltaicError
 
+from cursor import Cursor
 from environment import Environment
 from inverter import Inverter
 
-from solar_panel import SolarArray
-from battery import BatteryArray
+from solar_panel import SolarArray, SolarPanel
+from battery import Battery, BatteryArray
+from scheduler import TickScheduler, default_scheduler
+from snapshot import SystemSnapshot
+from streaming import TickBroadcaster
+from timeseries import TimeSeries, RetentionPolicy
 
-import time
+from datetime import datetime
+
+import metrics
 import threading
 
 
+
 class PhotoVoltaicSystem:
-    """Simulates a PV system; records state changes over time."""
+    """Simulates a PV system; records state changes over time.
+
+    The system owns its environment and advances the environment's clock once per
+    iteration, so environments should not be shared between systems.
+
+    Reads (json and the *_data methods) are served from a snapshot published at the end
+    of every tick, so they never wait for, or hold up, the tick loop.
+    """
     
-    def __init__(self, environment: Environment, panels: SolarArray, batteries: BatteryArray):
+    def __init__(self, environment: Environment, panels: SolarArray, batteries: BatteryArray,
+                 scheduler: TickScheduler = None, settlement: bool = False):
+        """Create a stopped PV system.
+
+        settlement: settle each tick's cooling power requests in one pass (see Inverter.settle).
+        """
         self._id: str = uuid('PV_SYSTEM')
         self._environment: Environment = environment
         self._panels: SolarArray = panels
         self._batteries: BatteryArray = batteries
-        self._inverter: Inverter = Inverter()
+        self._inverter: Inverter = Inverter(settlement)
         self._total_available_volts: Volt = 0
         self._total_solar_output: Watt = 0
+        self._aggregated_solar_output: Watt = 0                   # running totals, updated every tick
+        self._peak_solar_output: Watt = 0
         self._panel_cooling: bool = True
         self._active: bool = False
         self._update_interval: int = 1
         self._iterations_per_day: int = 54
         self._max_iterations: int = 170
         self._iterations: int = 0
-        self._time_series: List[dict] = []
+        self._time_series = TimeSeries({ 'time': 'i2', 'solar_array_output': 'f8', 'battery_array_power': 'f8' })
         self._metadata: dict = None
+        self._scheduler: TickScheduler = scheduler                # defaults to the process wide scheduler
+        self._retention: RetentionPolicy = None                   # unbounded history by default
+        self._broadcaster: TickBroadcaster = TickBroadcaster(self)
+        self._lock = threading.RLock()                            # held for a whole tick, e.g. by checkpoints;
+                                                                  # reentrant as a tick may stop the system
+        self._snapshot: SystemSnapshot = None                     # replaced, never mutated, once per tick
+        self._configuration: int = 0                              # bumped by reconfigured()
         
     def start(self):
         """Activate PV system."""
+        self._connect()
+        self._active = True
+        self.reconfigured()
+        (self._scheduler or default_scheduler()).add(self)          # ticks every self._update_interval
+
+    def fast_forward(self, start_time: datetime = None):
+        """Run the simulation to completion without sleeping between iterations.
+
+        The environment's clock is advanced once per iteration, exactly as in real time
+        mode, so results only differ in wall-clock duration. Returns the final system state.
+        """
+        if self._active:
+            raise PhotoVoltaicError('Simulation is already running.')
+        if start_time is not None:
+            self._environment.set_time(self._environment.clock.reset(start_time))
+        self._connect()
+        self._active = True
+        try:
+            while self._active:
+                self._tick()
+        except Exception:
+            self.stop()                                   # leave the system restartable
+            raise
+        return self.json()
+
+    def _connect(self):
+        """Validate configuration and wire components together."""
         if len(self._panels) == 0:
             raise PhotoVoltaicError('Please connect at least one solar panel.')
         if len(self._batteries) == 0:
             raise PhotoVoltaicError('Please connect at least one battery.')
+        if self._iterations > 0 and not self._environment.can_tick():
+            raise PhotoVoltaicError('The weather data for this site has ended.')
         self._inverter.connect_battery_array(self._batteries)              # connect inverter to battery array
         # connect solar panel cooling systems to inverter
         [panel._cooling_system.add_power_source(self._inverter) for panel in self._panels]
-        self._active = True
-        update_thread = threading.Thread(target=self._update)
-        update_thread.start()
-        
+
     def stop(self):
         """Deactivate PV system."""
         self._active = False
+        self._broadcaster.close()
+        self.reconfigured()
 
     def state(self):
         """Return most recent state."""
-        if len(self._time_series) > 0:
-            return self._time_series[-1]
-        return None    
+        return self._time_series.last()
     
+    def set_environment(self, environment: Environment):
+        """Move system and all of its panels to a different environment."""
+        self._environment = environment
+        for panel in self._panels:
+            panel._environment = environment
+        self._panels.invalidate()
+        self.reconfigured()
+
+    def set_retention(self, policy: RetentionPolicy):
+        """Bound history kept by the system and all of its components."""
+        if self._iterations > 0:
+            raise PhotoVoltaicError('Retention can only be set before the simulation starts.')
+        self._retention = policy
+        self._time_series.set_retention(policy)
+        self._inverter._time_series.set_retention(policy)
+        self._panels.set_retention(policy)
+        self._batteries.set_retention(policy)
+
     def set_max_iteration(self, value: int):
         """Set max iterations. Gives the client control of simulation length.
         
         value: integer value representing the number of days to run the sim.
         """
         self._max_iterations = value * self._iterations_per_day
+        self.reconfigured()
 
     def connect_panel_cooling(self, panel_id):
         """Called after a new solar panel is added to the system's solar array."""
-        [
-            panel._cooling_system.add_power_source(self._inverter) for panel in self._panels 
-            if panel._id == panel_id
-        ]
+        panel = self._panels.panel(panel_id)
+        panel._cooling_system.add_power_source(self._inverter)
         if not self._panel_cooling:                      # ensure newly added panels conform to existing settings
-            self.deactivate_panel_cooling()
+            panel._cooling_system.stop()
+            self._panels.refresh(panel_id)
+        self.reconfigured()
         
+    def add_panels(self, panels: List[SolarPanel]):
+        """Add several solar panels and connect their cooling systems in one operation.
+        Panels are wired before they are added, as the next tick may model them at once."""
+        for panel in panels:
+            panel._cooling_system.add_power_source(self._inverter)
+            if not self._panel_cooling:
+                panel._cooling_system.stop()
+            if self._metadata:
+                self._metadata['panels'][panel._id] = 0
+                self._metadata['cooling_systems'][panel._id] = 0
+        self._panels.add_many(panels)
+        self.reconfigured()
+
+    def add_batteries(self, batteries: List[Battery]):
+        """Connect several batteries in one operation."""
+        self._batteries.add_many(batteries)
+        if self._metadata:
+            for battery in batteries:
+                self._metadata['batteries'][battery._id] = 0
+        self.reconfigured()
+
     def activate_panel_cooling(self):
         """Turn on panel cooling for all solar panels in system."""
         [
             panel._cooling_system.start() for panel in self._panels 
         ]
+        self._panels.invalidate()
         self._panel_cooling = True
+        self.reconfigured()
         
     def deactivate_panel_cooling(self):
         """Turn off panel cooling for all solar panels in system."""
         [
             panel._cooling_system.stop() for panel in self._panels 
         ]
+        self._panels.invalidate()
         self._panel_cooling = False
+        self.reconfigured()
 
     def update_metadata(self, metadata):
         """Update PV system metadata. Typically the most recently acknowledged client data"""
         self._metadata = metadata
+        self.reconfigured()
 
-    def _update(self):
-        """Get current readings from solar and battery arrays."""
-        while self._active:
+    def _tick(self):
+        """Get current readings from solar and battery arrays. Returns False once the
+        simulation has reached its final iteration."""
+        with self._lock:
+            timer = metrics.tick_timer()                          # None while metrics are disabled
             panel_details = self._panels.json()
+            if timer: timer.lap('panels')
             self._total_solar_output = panel_details['total_output']
+            self._aggregated_solar_output += self._total_solar_output
+            self._peak_solar_output = max(self._peak_solar_output, self._total_solar_output)
             self._batteries.charge(panel_details['total_output']) # send output from solar array to battery array
-            battery_details = self._batteries.json()
+            if timer: timer.lap('battery_charge')
+            battery_details = self._batteries.status()
             self._total_available_volts = battery_details['available_power']
-            state = {
-                'index': len(self._time_series),                  # 0 based 
-                'time': self._environment._integer_time(self._environment._datetime, True),
-                'solar_array_output': panel_details['total_output'],
-                'battery_array_power': battery_details['available_power']
-            }
-            self._time_series.append(state)
-            if self._iterations > self._max_iterations:
-                print('Reached max iterations. Terminating simulation.')
-                self.stop()                                       # stop pv system
-            else:
+            if timer: timer.lap('battery_status')
+            self._time_series.append(
+                self._environment.conditions.hour,
+                panel_details['total_output'],
+                battery_details['available_power']
+            )
+            out_of_data = not self._environment.can_tick()        # recorded weather has ended
+            if not out_of_data:
+                self._environment.tick()                          # move simulated time forward
+            if timer: timer.lap('system_series_append')
+            finished = self._iterations > self._max_iterations or out_of_data
+            if not finished:
                 self._iterations += 1
-                time.sleep(self._update_interval)
+            self._publish()
+            if timer: timer.lap('snapshot')
+            if self._broadcaster.active:
+                self._broadcaster.publish()                       # push tick to stream subscribers
+                if timer: timer.lap('publish')
+            if timer: timer.stop()
+            if finished:
+                if out_of_data:
+                    print('Reached the end of the weather data. Terminating simulation.')
+                else:
+                    print('Reached max iterations. Terminating simulation.')
+                self.stop()                                       # stop pv system
+            return self._active
+
+    def _publish(self):
+        """Replace the snapshot with one of the current state. Called with the lock held."""
+        conditions = self._environment.conditions
+        self._snapshot = SystemSnapshot(
+            summary={
+                'datetime': self._environment.current_time,
+                'current_iteration': self._iterations,
+                'temperature': conditions.temperature,
+                'solar_irradiance': conditions.solar_irradiance,
+                'total_solar_output': self._total_solar_output,
+                'max_solar_output': self._panels._max_output,
+                'aggregated_solar_output': self._aggregated_solar_output,
+                'peak_solar_output': self._peak_solar_output,
+                'energy_in': self._batteries._energy_in,
+                'energy_out': self._batteries._energy_out,
+                'cooling_energy': self._inverter._energy_delivered,
+                'load_errors': self._inverter._load_errors,
+                'battery_array_power': self._total_available_volts,
+                'battery_array_soc' : self._batteries._avg_state_of_charge
+            },
+            ticks=len(self._time_series),
+            inverter=len(self._inverter._time_series),
+            inverter_output=self._inverter._output_power,
+            panels=tuple([
+                (panel, panel._current_output, panel._current_temperature, len(panel._time_series),
+                 panel._cooling_system._current_output, len(panel._cooling_system._time_series))
+                for panel in self._panels
+            ]),
+            batteries=tuple([
+                (battery, battery._state_of_charge, len(battery._time_series)) for battery in self._batteries
+            ])
+        )
+
+    def snapshot(self) -> SystemSnapshot:
+        """Return the state published by the most recent tick or reconfiguration."""
+        if self._snapshot is None:                                # not published since construction
+            with self._lock:
+                if self._snapshot is None:
+                    self._publish()
+        return self._snapshot
+
+    @property
+    def version(self) -> tuple:
+        """Changes whenever a read could return something different: when a tick is
+        published and when the system is reconfigured (see reconfigured)."""
+        snapshot = self._snapshot
+        return snapshot.ticks if snapshot is not None else len(self._time_series), self._configuration
+
+    def reconfigured(self):
+        """Record a change made outside a tick, e.g. adding a panel: publish it once, so
+        reads see it without rebuilding the snapshot, and rebuild cached reads."""
+        with self._lock:
+            self._publish()
+            self._configuration += 1
                 
-    def system_data(self):
+    def time_series(self) -> Dict[str, TimeSeries]:
+        """Return every time series of the system and its components, keyed by
+        'system', 'inverter', 'panel:<id>', 'cooling:<panel id>' or 'battery:<id>'."""
+        series = { 'system': self._time_series, 'inverter': self._inverter._time_series }
+        for panel in self._panels:
+            series[f'panel:{panel._id}'] = panel._time_series
+            series[f'cooling:{panel._id}'] = panel._cooling_system._time_series
+        for battery in self._batteries:
+            series[f'battery:{battery._id}'] = battery._time_series
+        return series
+
+    def cursor(self) -> Cursor:
+        """Return a cursor positioned at the end of the system's published history."""
+        snapshot = self.snapshot()
+        return Cursor(self._id, snapshot.ticks, snapshot.inverter)
+
+    def _offset(self, snapshot: SystemSnapshot, length: int, cursor: Cursor, key: str, component_id: str = None):
+        """Return the first unseen index of a series of length rows, from a client cursor or
+        the shared metadata."""
+        if cursor is not None:
+            return cursor.offset(length, snapshot.ticks)
+        if self._metadata:
+            return self._metadata[key][component_id] if component_id else self._metadata[key]
+        return 0
+
+    def system_data(self, cursor: Cursor = None):
         """Return system data."""
-        return self._time_series[self._metadata['system']:]  if self._metadata else self._time_series
+        snapshot = self.snapshot()
+        return self._time_series.rows(self._offset(snapshot, snapshot.ticks, cursor, 'system'), snapshot.ticks)
                 
-    def panel_data(self):
+    def panel_data(self, cursor: Cursor = None):
         """Return current data from all connected panels."""
+        snapshot = self.snapshot()
         return [
             {
                 'panel_id': panel._id,
                 'rating': panel._power_rating,
-                'output': panel._current_output,
-                'temperature': panel._current_temperature,
-                'efficiency': panel._calculate_efficiency(),
-                'time_series': panel._time_series[self._metadata['panels'][panel._id]:] if \
-                    self._metadata else panel._time_series
+                'output': output,
+                'temperature': temperature,
+                'efficiency': panel.efficiency(temperature),
+                'time_series': panel._time_series.rows(
+                    self._offset(snapshot, length, cursor, 'panels', panel._id), length)
             }
-            for panel in self._panels
+            for panel, output, temperature, length, _, _ in snapshot.panels
         ]
     
-    def inverter_data(self):
+    def inverter_data(self, cursor: Cursor = None):
         """Return current inverter data."""
+        snapshot = self.snapshot()
+        if cursor is not None:
+            offset = cursor.inverter_offset()
+        else:
+            offset = self._metadata['inverter'] if self._metadata else 0
         return {
             'max_output': self._inverter._max_output,
-            'output': self._inverter._output_power,
-            'time_series': self._inverter._time_series[self._metadata['inverter']:] if self._metadata else \
-                self._inverter._time_series
+            'output': snapshot.inverter_output,
+            'time_series': self._inverter._time_series.rows(offset, snapshot.inverter)
         }
         
-    def battery_data(self):
+    def battery_data(self, cursor: Cursor = None):
         """Return current battery data."""
+        snapshot = self.snapshot()
         return [
             {
                 'battery_id': battery._id,
                 'capacity': battery._volts,
                 'amps': battery._amperes,
-                'soc': battery._state_of_charge,
-                'time_series': battery._time_series[self._metadata['batteries'][battery._id]:] \
-                    if self._metadata else battery._time_series
+                'soc': state_of_charge,
+                'time_series': battery._time_series.rows(
+                    self._offset(snapshot, length, cursor, 'batteries', battery._id), length)
             }
-            for battery in self._batteries
+            for battery, state_of_charge, length in snapshot.batteries
         ]
     
-    def cooling_data(self):
+    def cooling_data(self, cursor: Cursor = None):
         """Return current cooling systems data."""
+        snapshot = self.snapshot()
         return {
             'cooling': self._panel_cooling,
             'data': [
                 {
                     'panel_id': panel._id,
                     'max_output': panel._cooling_system._max_output,
-                    'output': panel._cooling_system._current_output,
-                    'time_series': panel._cooling_system._time_series[self._metadata['cooling_systems'][panel._id]:] \
-                        if self._metadata else panel._cooling_system._time_series
+                    'output': output,
+                    'time_series': panel._cooling_system._time_series.rows(
+                        self._offset(snapshot, length, cursor, 'cooling_systems', panel._id), length)
                 }
-                for panel in self._panels
+                for panel, _, _, _, output, length in snapshot.panels
             ]
         }
         
+    def panels_json(self):
+        """Return json representation of every panel, as published by the last tick."""
+        return [
+            panel.json(temperature, length) for panel, _, temperature, length, _, _ in self.snapshot().panels
+        ]
+
     def get_iterations(self):
         """Return details about the current simulations iterations."""
         return { 'min': self._iterations, 'max': self._max_iterations }
 
-    def json(self):
+    def json(self, snapshot: SystemSnapshot = None):
         """Return current photovoltaic data.
-        """        
+
+        snapshot: report this snapshot instead of the latest, e.g. to match data read from it.
+        """
         return {
             'system_id': self._id,
+            'seed': self._environment.seed,
             'active': self._active,
-            'datetime': self._environment.current_time,
-            'current_iteration': self._iterations,
             'max_iteration': self._max_iterations,
-            'temperature': self._environment.temperature,
-            'solar_irradiance': self._environment.solar_irradiance(),
-            'total_solar_output': self._total_solar_output,
-            'max_solar_output': sum([panel._power_rating for panel in self._panels]) + (60 * len(self._panels)),
-            'aggregated_solar_output': sum([cycle['solar_array_output'] for cycle in self._time_series]),
+            'settlement': self._inverter._settlement,
             'panel_cooling': self._panel_cooling,
-            'battery_array_power': self._total_available_volts,
-            'battery_array_soc' : self._batteries._avg_state_of_charge,
+            'site': self._environment.weather.site if self._environment.weather is not None else None,
+            **(snapshot or self.snapshot()).summary
         }
@@ -0,0 +1,194 @@
+from typing import Dict
+from collections import OrderedDict
+
+from pv_system import PhotoVoltaicSystem
+
+import json
+import threading
+import time
+import zlib
+
+
+class SimulationRegistry:
+    """Resident PV systems keyed by id, with lifecycle management.
+
+    Lookups are O(1) and keep systems in least recently used order. Stopped systems
+    are evicted when unread for idle_seconds, finished systems (stopped after their
+    last iteration) when unread for finished_seconds, and the least recently used
+    stopped systems when more than max_resident systems are held. Running systems are
+    never evicted.
+
+    With a CheckpointStore, evicted systems are checkpointed first and a lookup that
+    misses restores the system from its checkpoint, so systems from a previous process
+    come back on first use rather than all at startup. Without one, evicted systems are
+    archived in memory as compressed summaries, dropping the oldest beyond
+    max_archive_bytes.
+    """
+
+    def __init__(self, idle_seconds: float = None, finished_seconds: float = None, max_resident: int = None,
+                 eviction_interval: float = 60, store=None, max_archive_bytes: int = 64 * 1024 * 1024):
+        self._systems: 'OrderedDict[str, PhotoVoltaicSystem]' = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._archive: 'OrderedDict[str, bytes]' = OrderedDict()     # oldest eviction first, without a store
+        self._archive_bytes: int = 0
+        self._max_archive_bytes: int = max_archive_bytes
+        self._idle_seconds: float = idle_seconds
+        self._finished_seconds: float = finished_seconds
+        self._max_resident: int = max_resident
+        self._store = store                            # optional CheckpointStore
+        self._lock = threading.RLock()
+        if idle_seconds is not None or finished_seconds is not None:
+            self._evictor = threading.Thread(target=self._evict_periodically, args=(eviction_interval,), daemon=True)
+            self._evictor.start()
+
+    def __len__(self):
+        return len(self._systems)
+
+    def __contains__(self, system_id: str):
+        return system_id in self._systems
+
+    def __iter__(self):
+        return iter(list(self._systems.values()))
+
+    def add(self, system: PhotoVoltaicSystem):
+        """Register a system, evicting others if the resident cap is exceeded."""
+        with self._lock:
+            self._systems[system._id] = system
+            self._last_access[system._id] = time.monotonic()
+            self._enforce_cap()
+        return system
+
+    def get(self, system_id: str) -> PhotoVoltaicSystem:
+        """Get a resident system by id."""
+        with self._lock:
+            system = self._systems.get(system_id)
+            if system is None:
+                system = self._restore(system_id)
+            self._systems.move_to_end(system_id)
+            self._last_access[system_id] = time.monotonic()
+            return system
+
+    def resident(self, system_id: str) -> PhotoVoltaicSystem:
+        """Return a resident system, or None, without restoring from the store or waiting
+        for the registry lock. Safe to call from an event loop."""
+        system = self._systems.get(system_id)
+        if system is not None and self._lock.acquire(blocking=False):     # recency is best effort under contention
+            try:
+                if system_id in self._systems:
+                    self._systems.move_to_end(system_id)
+                    self._last_access[system_id] = time.monotonic()
+            finally:
+                self._lock.release()
+        return system
+
+    def remove(self, system_id: str):
+        """Stop and forget a system, including any archived copy."""
+        with self._lock:
+            system = self._systems.pop(system_id, None)
+            self._last_access.pop(system_id, None)
+            archived = self._discard_archived(system_id)
+        stored = self._store is not None and system_id in self._store
+        if system is None and archived is None and not stored:
+            raise ValueError('PVS_NOT_FOUND')
+        if system is not None:
+            system.stop()
+        if stored:
+            self._store.delete(system_id)
+        return { 'result': 'SUCCESS' }
+
+    def archived(self, system_id: str) -> dict:
+        """Return the archived summary of an evicted system. With a store, it is built from
+        the system's checkpoint."""
+        if self._store is not None and system_id not in self._systems and system_id in self._store:
+            return self._summary(self._store.load(system_id, resume=False))
+        archived = self._archive.get(system_id)
+        if archived is None:
+            raise ValueError('PVS_NOT_FOUND')
+        return json.loads(zlib.decompress(archived))
+
+    def evict(self):
+        """Apply idle, finished and resident cap policies. Returns evicted system ids."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for system_id, system in list(self._systems.items()):
+                if system._active:
+                    continue
+                idle = now - self._last_access[system_id]
+                finished = system._iterations > system._max_iterations
+                if (self._idle_seconds is not None and idle >= self._idle_seconds) or \
+                        (finished and self._finished_seconds is not None and idle >= self._finished_seconds):
+                    self._evict(system_id)
+                    evicted.append(system_id)
+            evicted.extend(self._enforce_cap())
+        return evicted
+
+    def json(self):
+        """Return registry statistics."""
+        return {
+            'resident': len(self._systems),
+            'running': len([system for system in self._systems.values() if system._active]),
+            'archived': len(self._archive),
+            'archive_bytes': self._archive_bytes,
+            'checkpointed': len(self._store.system_ids()) if self._store is not None else None,
+            'idle_seconds': self._idle_seconds,
+            'finished_seconds': self._finished_seconds,
+            'max_resident': self._max_resident
+        }
+
+    def _enforce_cap(self):
+        """Evict least recently used stopped systems until under the resident cap."""
+        evicted = []
+        if self._max_resident is None or len(self._systems) <= self._max_resident:
+            return evicted
+        for system_id, system in list(self._systems.items()):         # oldest access first
+            if len(self._systems) <= self._max_resident:
+                break
+            if not system._active:
+                self._evict(system_id)
+                evicted.append(system_id)
+        return evicted
+
+    def _restore(self, system_id: str) -> PhotoVoltaicSystem:
+        """Bring a system back from its checkpoint. Caller holds self._lock."""
+        if self._store is None or system_id not in self._store:
+            raise ValueError('PVS_ARCHIVED' if system_id in self._archive else 'PVS_NOT_FOUND')
+        system = self._store.load(system_id)
+        self._discard_archived(system_id)
+        self._systems[system_id] = system
+        self._last_access[system_id] = time.monotonic()
+        self._enforce_cap()
+        return system
+
+    def _evict(self, system_id: str):
+        """Move a system out of memory, into the store or the archive. Caller holds self._lock."""
+        if self._store is not None:
+            self._store.save(self._systems[system_id])
+        system = self._systems.pop(system_id)
+        self._last_access.pop(system_id)
+        if self._store is None:
+            archived = zlib.compress(json.dumps(self._summary(system), separators=(',', ':')).encode())
+            if len(archived) <= self._max_archive_bytes:
+                self._archive[system_id] = archived
+                self._archive_bytes += len(archived)
+            while self._archive_bytes > self._max_archive_bytes:
+                self._discard_archived(next(iter(self._archive)))
+
+    def _discard_archived(self, system_id: str) -> bytes:
+        """Remove and return an archived summary, or None. Caller holds self._lock."""
+        archived = self._archive.pop(system_id, None)
+        if archived is not None:
+            self._archive_bytes -= len(archived)
+        return archived
+
+    @staticmethod
+    def _summary(system: PhotoVoltaicSystem) -> dict:
+        return {
+            'summary': system.json(),
+            'system': system._time_series.rows()
+        }
+
+    def _evict_periodically(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.evict()
@@ -0,0 +1,91 @@
+from typing import Hashable, Optional, Tuple
+
+from collections import OrderedDict
+
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """Serialised responses shared by every client, bounded by memory.
+
+    Entries are keyed by (system id, endpoint, parameters) and tagged with the version
+    of the system they were built from (see PhotoVoltaicSystem.version), so a tick or a
+    reconfiguration invalidates them and each key holds at most one response. The least
+    recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    ENTRY_OVERHEAD = 256              # rough bytes per entry beyond its content: key, tag, bookkeeping
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self._max_bytes: int = max_bytes
+        self._entries: OrderedDict = OrderedDict()       # key -> (version, etag, content)
+        self._bytes: int = 0
+        self._hits: int = 0
+        self._misses: int = 0
+        self._evictions: int = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Tuple[str, bytes]]:
+        """Return (etag, content) if key was cached at version, otherwise None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key: Hashable, version: Hashable, content: bytes) -> Tuple[str, bytes]:
+        """Cache content for key at version, replacing older versions. Returns (etag, content)."""
+        etag = f'"{hashlib.blake2b(content, digest_size=12).hexdigest()}"'
+        size = len(content) + self.ENTRY_OVERHEAD
+        with self._lock:
+            self._discard(key)
+            if size <= self._max_bytes:
+                self._entries[key] = (version, etag, content)
+                self._bytes += size
+                while self._bytes > self._max_bytes:
+                    self._discard(next(iter(self._entries)))
+                    self._evictions += 1
+        return etag, content
+
+    def invalidate(self, system_id: str):
+        """Drop every response cached for a system, e.g. when it is deleted."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == system_id]:
+                self._discard(key)
+
+    def json(self):
+        """Return cache statistics."""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self._max_bytes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions
+        }
+
+    def _discard(self, key: Hashable):
+        """Remove an entry if present. Caller holds self._lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2]) + self.ENTRY_OVERHEAD
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Return whether an If-None-Match header value matches etag, using weak comparison."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in [candidate[2:] if candidate.startswith('W/') else candidate
+                                         for candidate in candidates]
@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import heapq
+import itertools
+import metrics
+import threading
+import time
+
+
+class TickScheduler:
+    """Owns every running PV system and dispatches due ticks onto a bounded worker pool.
+
+    Systems are kept in a priority queue ordered by next tick time. A system never has
+    more than one tick in flight, and a system that falls behind is requeued at the
+    current time rather than its missed slot, so slow systems can't starve the rest.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        """Create scheduler and start its dispatcher thread."""
+        self._max_workers: int = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tick')
+        self._workers = threading.Semaphore(max_workers)
+        self._condition = threading.Condition()
+        self._queue: list = []                          # heap of (due, sequence, system)
+        self._scheduled: set = set()                    # ids of queued or running systems
+        self._sequence = itertools.count()              # breaks ties in fifo order
+        self._running: int = 0
+        self._ticks: int = 0
+        self._errors: int = 0
+        self._last_lag: float = 0.0
+        self._max_lag: float = 0.0
+        self._total_lag: float = 0.0
+        self._closed: bool = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def tick_lag(self) -> float:
+        return self._last_lag
+
+    def add(self, system, delay: float = 0):
+        """Start ticking a system. Systems that are already scheduled are left alone."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Scheduler has been shut down.')
+            if system._id in self._scheduled:
+                return
+            self._scheduled.add(system._id)
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), system))
+            self._condition.notify()
+
+    def _dispatch(self):
+        """Hand due ticks to the worker pool, earliest first."""
+        while True:
+            self._workers.acquire()                     # wait for a free worker before popping
+            with self._condition:
+                while not self._closed:
+                    if self._queue:
+                        delay = self._queue[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+                if self._closed:
+                    return
+                due, _, system = heapq.heappop(self._queue)
+                dispatch = system._active
+                if dispatch:
+                    self._running += 1
+                else:                                   # stopped while queued
+                    self._scheduled.discard(system._id)
+            if not dispatch:
+                self._workers.release()
+                continue
+            try:
+                self._executor.submit(self._tick, system, due)
+            except RuntimeError:                        # executor shut down at interpreter exit
+                return
+
+    def shutdown(self):
+        """Stop dispatching and wait for ticks in flight. Queued systems are not ticked again."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._workers.release()                         # wake the dispatcher if it waits for a worker
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+
+    def _tick(self, system, due: float):
+        """Run a single tick then requeue the system if it is still active."""
+        started = time.monotonic()
+        lag = started - due
+        if metrics.ENABLED:
+            metrics.TICK_LAG_SECONDS.observe(lag)
+        failed = False
+        try:
+            active = system._tick()
+        except Exception as e:
+            print(f'Tick failed for {system._id}: {e}. Stopping simulation.')
+            system.stop()
+            active = False
+            failed = True
+        finally:
+            self._workers.release()
+        with self._condition:
+            self._running -= 1
+            self._ticks += 1
+            self._errors += failed
+            self._last_lag = lag
+            self._total_lag += lag
+            self._max_lag = max(self._max_lag, lag)
+            if active and system._active:
+                next_due = max(due + system._update_interval, time.monotonic())
+                heapq.heappush(self._queue, (next_due, next(self._sequence), system))
+                self._condition.notify()
+            else:
+                self._scheduled.discard(system._id)
+
+    def json(self):
+        """Return scheduler statistics."""
+        return {
+            'max_workers': self._max_workers,
+            'queue_depth': self.queue_depth,
+            'running': self._running,
+            'ticks': self._ticks,
+            'errors': self._errors,
+            'tick_lag': self._last_lag,
+            'max_tick_lag': self._max_lag,
+            'mean_tick_lag': self._total_lag / self._ticks if self._ticks else 0.0
+        }
+
+
+_scheduler: TickScheduler = None
+_scheduler_lock = threading.Lock()
+
+def default_scheduler() -> TickScheduler:
+    """Return the process wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TickScheduler()
+        return _scheduler
@@ -0,0 +1,17 @@
+from typing import NamedTuple, Tuple
+
+
+class SystemSnapshot(NamedTuple):
+    """Immutable view of a PV system at the end of one tick.
+
+    Published by the tick loop once per tick, and once per change made between ticks
+    (see PhotoVoltaicSystem._publish), so reads never take the system's lock. Time
+    series are referenced with their lengths at publication: rows below those lengths
+    never change, so a reader slices history up to them while later ticks append beyond.
+    """
+    summary: dict                      # PhotoVoltaicSystem.json fields that change each tick
+    ticks: int                         # length of the system series, one row per tick
+    inverter: int                      # length of the inverter series
+    inverter_output: float
+    panels: Tuple[tuple, ...]          # (panel, output, temperature, series length, cooling output, cooling length)
+    batteries: Tuple[tuple, ...]       # (battery, state of charge, series length)
@@ -1,10 +1,12 @@
-import random
+import threading
 
-from typing import List, Union
+from typing import Dict, List, Union
 from simulator_types import Celcius, Percentage, Watt
 
 from cooling_system import CoolingSystem
 from environment import Environment
+from panel_bank import PanelBank
+from timeseries import TimeSeries, RetentionPolicy, STATIC
 from utils import uuid, variation
 
 
@@ -12,7 +14,7 @@ class SolarPanel:
     """A solar panel."""
     
     def __init__(self, params):
-        self._id: str = uuid('PANEL')
+        self._id: str = params.get('panel_id') or uuid('PANEL')             # ids may be allocated in bulk
         self._environment: Environment = params['environment']
         self._power_rating: Watt = params['standard_conditions']['power_rating']
         self._efficiency: Percentage = params['standard_conditions']['efficiency']
@@ -21,8 +23,11 @@ class SolarPanel:
         self._current_temperature: Celcius = 0.0
         self._current_output: Watt = 0
         self._area = params['area']
-        self._cooling_system: CoolingSystem = CoolingSystem()
-        self._time_series = []
+        self._cooling_system: CoolingSystem = CoolingSystem(self._id, params.get('cooling_id'))
+        self._time_series = TimeSeries(
+            { 'panel_id': STATIC, 'power_output': 'f8', 'panel_temperature': 'f8' },
+            static={ 'panel_id': self._id }
+        )
 
     def status(self):   # resolved: called twice as much as pv system and battery
         """Return panel status."""
@@ -33,16 +38,16 @@ class SolarPanel:
             'power_output': self._current_output,
             'panel_temperature': self._current_temperature
         }
-        self._time_series.append(state)
+        self._time_series.append(self._current_output, self._current_temperature)
         return state
         
     def _get_power_output(self):
         """Takes solar irradiance and panel temperature as input, returns panel power
         output in watts.
         """
-        solar_irradiance = self._environment.solar_irradiance() * self._area
+        solar_irradiance = self._environment.conditions.solar_irradiance * self._area
         efficiency = self._calculate_efficiency()
-        return variation((solar_irradiance * efficiency) / 3)
+        return variation((solar_irradiance * efficiency) / 3, rng=self._environment.random)
         
     def _calculate_efficiency(self):
         """Calculate the panels efficiency based on its temperature."""
@@ -54,9 +59,18 @@ class SolarPanel:
         else:
             return self._efficiency
         
+    def efficiency(self, temperature: Celcius = None):
+        """Return efficiency at temperature (the panel's current temperature by default),
+        without touching cooling state."""
+        temperature = self._current_temperature if temperature is None else temperature
+        if temperature > self._optimal_temperature:
+            degrees_above_threshold = temperature - self._optimal_temperature
+            return self._efficiency - (self._temperature_coefficient * degrees_above_threshold)
+        return self._efficiency
+
     def _get_panel_temperature(self):
         """Calculate panel temperature based on environment temperatures and cooling factors."""
-        environment_temp = self._environment.temperature
+        environment_temp = self._environment.conditions.temperature
         self._current_temperature = environment_temp - self._cooling_factors()
         return self._current_temperature
         
@@ -72,32 +86,45 @@ class SolarPanel:
                     self._cooling_system._current_output -= 1   # decrease cooling system output by 1℃
             return self._cooling_system.yield_(self._id)
         self._cooling_system.yield_(self._id, reset=True)
-        return random.uniform(0, 3)
+        return self._environment.random.uniform(0, 3)
 
-    def json(self):
-        """Return json representation of panel."""
+    def json(self, temperature: Celcius = None, length: int = None):
+        """Return json representation of panel.
+
+        temperature, length: values published for the panel by its system (see
+        PhotoVoltaicSystem.snapshot), so the history read is bounded. Default to current.
+        """
         return {
             'panel_id': self._id,
             'power_rating': self._power_rating,
             'efficiency': self._efficiency,
             'temperature_coefficient': self._temperature_coefficient,
             'optimal_temperature': self._optimal_temperature,
-            'current_temperature': self._current_temperature,
+            'current_temperature': self._current_temperature if temperature is None else temperature,
             'area': self._area,
-            'time_series': self._time_series
+            'time_series': self._time_series.rows(0, length)
         }
 
 
 class SolarArray:
     """Creates a single interface to an array of solar panels."""
     
-    def __init__(self):
-        """Create an empty solar panel array."""
+    def __init__(self, vectorized: bool = True):
+        """Create an empty solar panel array.
+
+        vectorized: model all panels in one pass with a PanelBank instead of panel by panel.
+        """
         self._id = uuid('SP_ARRAY')
         self._panel_array: List[SolarPanel] = []
         self._array_temperature: Celcius = 0
         self._total_output: Watt = 0
+        self._max_output: Watt = 0                       # sum of panel ratings plus headroom
         self._cooling_system = None
+        self._vectorized: bool = vectorized
+        self._panel_bank: PanelBank = None               # built lazily, dropped on reconfiguration
+        self._retention: RetentionPolicy = None
+        self._slots: Dict[str, int] = {}                 # panel id -> position in self._panel_array
+        self._lock = threading.Lock()                    # reconfiguration waits for the current tick
 
     def __iter__(self):
         for panel in self._panel_array:
@@ -105,34 +132,117 @@ class SolarArray:
             
     def __len__(self):
         return len(self._panel_array)
+
+    def __contains__(self, panel_id: str):
+        return panel_id in self._slots
         
     def add(self, panel: SolarPanel):
         """Add a solar panel to the array."""
-        self._panel_array.append(panel)
+        if self._retention is not None:
+            panel._time_series.set_retention(self._retention)
+            panel._cooling_system._time_series.set_retention(self._retention)
+        with self._lock:
+            self._slots[panel._id] = len(self._panel_array)
+            self._panel_array.append(panel)
+            self._max_output += panel._power_rating + 60
+            if self._panel_bank is not None:
+                self._panel_bank.add(panel)
+        return { 'result': 'SUCCESS' }
+
+    def add_many(self, panels: List[SolarPanel]):
+        """Add several solar panels in one operation."""
+        if self._retention is not None:
+            for panel in panels:
+                panel._time_series.set_retention(self._retention)
+                panel._cooling_system._time_series.set_retention(self._retention)
+        with self._lock:
+            for panel in panels:
+                self._slots[panel._id] = len(self._panel_array)
+                self._panel_array.append(panel)
+                self._max_output += panel._power_rating + 60
+            if self._panel_bank is not None:
+                self._panel_bank.extend(panels)
         return { 'result': 'SUCCESS' }
+
+    def panel(self, panel_id: str) -> SolarPanel:
+        """Get target solar panel."""
+        try:
+            return self._panel_array[self._slots[panel_id]]
+        except KeyError:
+            raise ValueError('PANEL_NOT_FOUND')
         
     def get(self, panel_id: str):
         """Get target solar panel details."""
-        for panel in self._panel_array:
-            if panel._id == panel_id:
-                return panel.json()
-        raise ValueError('PANEL_NOT_FOUND')
+        return self.panel(panel_id).json()
     
     def remove(self, panel_id: str):
-        """Remove a solar panel from the array."""
-        for panel in self._panel_array:
-            if panel._id == panel_id:
-                panel._cooling_system.yield_(panel._id, reset=True)    # reset cooling system
-                self._panel_array.pop(self._panel_array.index(panel))
-                return { 'result': 'SUCCESS' }
-        raise ValueError('PANEL_NOT_FOUND')
+        """Remove a solar panel from the array. The last panel takes the removed panel's slot."""
+        with self._lock:
+            self._remove(panel_id)
+        return { 'result': 'SUCCESS' }
+
+    def remove_many(self, panel_ids: List[str]):
+        """Remove several solar panels in one operation. Unknown ids are rejected before
+        any panel is removed; repeated ids remove their panel once."""
+        panel_ids = list(dict.fromkeys(panel_ids))
+        with self._lock:
+            [self.panel(panel_id) for panel_id in panel_ids]
+            for panel_id in panel_ids:
+                self._remove(panel_id)
+        return { 'result': 'SUCCESS' }
+
+    def _remove(self, panel_id: str):
+        """Swap-remove a panel. Caller holds self._lock."""
+        panel = self.panel(panel_id)
+        panel._cooling_system.yield_(panel._id, reset=True)    # reset cooling system
+        slot = self._slots.pop(panel_id)
+        last = self._panel_array.pop()
+        if last is not panel:
+            self._panel_array[slot] = last
+            self._slots[last._id] = slot
+        self._max_output -= panel._power_rating + 60
+        if self._panel_bank is not None:
+            self._panel_bank.remove(slot)
         
+    def set_retention(self, policy: RetentionPolicy):
+        """Apply a retention policy to all current and future panels."""
+        self._retention = policy
+        for panel in self._panel_array:
+            panel._time_series.set_retention(policy)
+            panel._cooling_system._time_series.set_retention(policy)
+
+    def refresh(self, panel_id: str):
+        """Pick up changes made directly to a panel, e.g. to its cooling system."""
+        with self._lock:
+            if self._panel_bank is not None:
+                self._panel_bank.refresh(self._slots[panel_id])
+
+    def invalidate(self):
+        """Discard the panel bank so it is rebuilt on the next tick. Called after changes
+        to every panel, e.g. switching all cooling systems on or off. Waits for a tick
+        in progress."""
+        with self._lock:
+            self._panel_bank = None
+
     def json(self):
         """Return current panel status."""
-        panel_details = [panel.status() for panel in self._panel_array]
-        panel_temps = [panel['panel_temperature'] for panel in panel_details]
-        self._array_temperature = sum(panel_temps) / len(self._panel_array)
-        self._total_output = sum([panel['power_output'] for panel in panel_details])
+        with self._lock:
+            return self._tick()
+
+    def _tick(self):
+        """Model every panel for one tick."""
+        if self._vectorized:
+            panel_bank = self._panel_bank
+            if panel_bank is None:
+                panel_bank = self._panel_bank = PanelBank(self._panel_array)
+            panel_outputs, panel_temps = panel_bank.tick()
+            self._array_temperature = float(panel_temps.mean())
+            self._total_output = float(panel_outputs.sum())
+        else:
+            panel_details = [panel.status() for panel in self._panel_array]
+            panel_temps = [panel['panel_temperature'] for panel in panel_details]
+            self._array_temperature = sum(panel_temps) / len(self._panel_array)
+            self._total_output = sum([panel['power_output'] for panel in panel_details])
         return {
             'array_id': self._id,
             'array_temperature': self._array_temperature,
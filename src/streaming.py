@@ -0,0 +1,130 @@
+from typing import List
+
+from collections import deque
+
+import asyncio
+import json
+import threading
+
+
+CHANNELS = ('system', 'panels', 'batteries', 'inverter', 'cooling')
+
+
+class Subscription:
+    """A subscriber's bounded queue of tick frames.
+
+    Frames are pushed from the tick loop and consumed on an asyncio event loop. When a
+    consumer falls behind, the oldest frames are dropped and counted, so a slow client
+    costs at most max_frames frames of memory. The drop count is reported with the next
+    delivered frame so the client can resync through /pv/system/data.
+    """
+
+    def __init__(self, channels: List[str], loop: asyncio.AbstractEventLoop, max_frames: int = 32):
+        unknown = [channel for channel in channels if channel not in CHANNELS]
+        if unknown:
+            raise ValueError(f'UNKNOWN_CHANNEL: {", ".join(unknown)}')
+        self._channels = set(channels)
+        self._loop = loop
+        self._frames: deque = deque(maxlen=max_frames)
+        self._ready = asyncio.Event()
+        self._signalled: bool = False              # avoids waking the loop once per frame
+        self._dropped: int = 0
+        self._closed: bool = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed and not self._frames
+
+    def push(self, channel: str, tick: int, cursor: str, payload: str):
+        """Queue a frame. Called from the tick loop."""
+        if len(self._frames) == self._frames.maxlen:
+            self._dropped += 1
+        self._frames.append((channel, tick, cursor, payload))
+        self._wake()
+
+    def close(self):
+        """Mark subscription as finished once queued frames are consumed."""
+        self._closed = True
+        self._wake()
+
+    async def get(self) -> List[str]:
+        """Wait for frames, return them rendered as json documents."""
+        await self._ready.wait()
+        self._ready.clear()
+        self._signalled = False
+        dropped, self._dropped = self._dropped, 0
+        frames = []
+        while self._frames:
+            channel, tick, cursor, payload = self._frames.popleft()
+            frames.append((channel, (
+                f'{{"channel": "{channel}", "tick": {tick}, "cursor": "{cursor}", '
+                f'"dropped": {dropped}, "data": {payload}}}'
+            )))
+            dropped = 0
+        return frames
+
+    def _wake(self):
+        if not self._signalled:
+            self._signalled = True
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:                       # event loop already closed
+                self._closed = True
+
+
+class TickBroadcaster:
+    """Fans each tick of a PV system out to its stream subscribers.
+
+    Channel payloads are built and serialised once per tick, and only for channels
+    somebody is subscribed to; each payload holds the rows added since the previous tick.
+    """
+
+    def __init__(self, system):
+        self._system = system
+        self._subscriptions: tuple = ()             # replaced, never mutated, so ticks can iterate freely
+        self._lock = threading.Lock()
+        self._cursor = None
+
+    @property
+    def active(self) -> bool:
+        return len(self._subscriptions) > 0
+
+    def subscribe(self, channels: List[str], loop: asyncio.AbstractEventLoop, max_frames: int = 32):
+        """Add a subscriber to the selected channels."""
+        subscription = Subscription(channels, loop, max_frames)
+        with self._lock:
+            if not self._subscriptions:
+                self._cursor = self._system.cursor()
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a subscriber."""
+        with self._lock:
+            self._subscriptions = tuple([
+                existing for existing in self._subscriptions if existing is not subscription
+            ])
+
+    def publish(self):
+        """Send rows added since the last publish to every subscriber."""
+        subscriptions = self._subscriptions
+        channels = set().union(*[subscription._channels for subscription in subscriptions])
+        cursor, self._cursor = self._cursor, self._system.cursor()
+        token = self._cursor.encode()
+        tick = len(self._system._time_series) - 1
+        builders = {
+            'system': self._system.system_data,
+            'panels': self._system.panel_data,
+            'batteries': self._system.battery_data,
+            'inverter': self._system.inverter_data,
+            'cooling': self._system.cooling_data
+        }
+        payloads = { channel: json.dumps(builders[channel](cursor)) for channel in channels }
+        for subscription in subscriptions:
+            for channel in subscription._channels:
+                subscription.push(channel, tick, token, payloads[channel])
+
+    def close(self):
+        """End every subscription, e.g. when the system stops."""
+        for subscription in self._subscriptions:
+            subscription.close()
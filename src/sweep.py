@@ -0,0 +1,140 @@
+from typing import List
+from concurrent.futures import ProcessPoolExecutor
+
+from clock import SimulationClock
+from environment import Environment
+from pv_system import PhotoVoltaicSystem
+from solar_panel import SolarPanel, SolarArray
+from battery import Battery, BatteryArray
+from weather import WeatherLibrary
+
+from datetime import datetime
+
+import copy
+import itertools
+import multiprocessing
+import time
+
+
+DEFAULT_CONFIGURATION = {
+    'panels': {
+        'count': 4,
+        'stc': {
+            'power_rating': 100,
+            'efficiency': 0.23,
+            'temperature': { 'unit': 'Celcius', 'value': 25 }
+        },
+        'temp_coefficient': 0.02,
+        'area': 3
+    },
+    'batteries': {
+        'count': 2,
+        'volts': 12,
+        'amps': 100,
+        'connection_type': 'series'
+    },
+    'cooling': True,
+    'settlement': False,
+    'days': 1,
+    'weather': None,              # site name; recorded weather replaces the daily profile
+    'start_time': None,           # ISO 8601, defaults to the start of the site's weather
+    'seed': None                  # a fixed seed makes variants comparable and reproducible
+}
+
+
+def build_system(config: dict, weather: WeatherLibrary = None) -> PhotoVoltaicSystem:
+    """Create a PV system from a configuration shaped like DEFAULT_CONFIGURATION.
+
+    weather: where to find the site named by config['weather'].
+    """
+    clock = None
+    dataset = None
+    if config.get('weather'):
+        if weather is None:
+            raise ValueError('WEATHER_UNAVAILABLE')
+        dataset = weather.dataset(config['weather'])
+        start_time = datetime.fromisoformat(config['start_time']) if config.get('start_time') else dataset.start
+        clock = SimulationClock(start_time)
+    elif config.get('start_time'):
+        clock = SimulationClock(datetime.fromisoformat(config['start_time']))
+    environment = Environment(clock, config.get('seed'), dataset)
+    solar_array = SolarArray()
+    battery_array = BatteryArray(config['batteries'].get('connection_type', 'series'))
+    panel_config = config['panels']
+    for _ in range(panel_config['count']):
+        solar_array.add(SolarPanel({
+            'environment': environment,
+            'standard_conditions': panel_config['stc'],
+            'temp_coefficient': panel_config['temp_coefficient'],
+            'area': panel_config['area']
+        }))
+    battery_config = config['batteries']
+    for _ in range(battery_config['count']):
+        battery_array.add(Battery(volts=battery_config['volts'], amps=battery_config['amps']))
+    system = PhotoVoltaicSystem(environment=environment, panels=solar_array, batteries=battery_array,
+                                settlement=config.get('settlement', False))
+    system.set_max_iteration(config['days'])
+    if not config['cooling']:
+        system.deactivate_panel_cooling()
+    return system
+
+
+def expand_grid(base: dict, grid: dict) -> List[dict]:
+    """Return one configuration per combination of grid values.
+
+    Grid keys are dotted paths into the base configuration, e.g. 'batteries.volts'.
+    """
+    variants = []
+    keys = list(grid.keys())
+    for values in itertools.product(*[grid[key] for key in keys]):
+        config = copy.deepcopy(base)
+        for key, value in zip(keys, values):
+            target = config
+            *parents, leaf = key.split('.')
+            for parent in parents:
+                target = target[parent]
+            if leaf not in target:
+                raise KeyError(f'Unknown sweep parameter: {key}')
+            target[leaf] = value
+        variants.append({ 'parameters': dict(zip(keys, values)), 'config': config })
+    return variants
+
+
+def run_variant(variant: dict) -> dict:
+    """Fast-forward a single variant to completion and summarise the result."""
+    started = time.perf_counter()
+    directory = variant.get('weather_directory')
+    system = build_system(variant['config'], WeatherLibrary(directory) if directory else None)
+    details = system.fast_forward()
+    return {
+        **variant['parameters'],
+        'seed': system._environment.seed,
+        'final_soc': details['battery_array_soc'],
+        'aggregated_solar_output': details['aggregated_solar_output'],
+        'cooling_load_errors': sum([panel._cooling_system._load_errors for panel in system._panels]),
+        'inverter_load_errors': system._inverter._load_errors,
+        'iterations': details['current_iteration'],
+        'elapsed_seconds': time.perf_counter() - started
+    }
+
+
+def run_sweep(base: dict, grid: dict, max_workers: int = None, weather_directory: str = None) -> List[dict]:
+    """Run every variant of base across a process pool, return a summary table.
+
+    weather_directory: weather library for variants that name a site. Each worker maps
+    a site's file once, and the operating system shares its pages between workers.
+    """
+    config = copy.deepcopy(DEFAULT_CONFIGURATION)
+    for key, value in base.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    variants = expand_grid(config, grid)
+    for variant in variants:
+        variant['weather_directory'] = weather_directory
+    # workers must not be forked from the server: its scheduler and checkpoint threads
+    # may hold locks at the fork, which would stay held in the child forever
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(method)) as pool:
+        return list(pool.map(run_variant, variants))
@@ -0,0 +1,37 @@
+import contextlib
+import io
+
+import pytest
+
+from battery import Battery
+from battery_bank import BatteryBank
+from sweep import DEFAULT_CONFIGURATION, build_system
+
+
+@pytest.mark.parametrize('connection_type', ['series', 'parallel'])
+def test_bank_matches_battery_by_battery_model(connection_type):
+    results = []
+    for vectorized in (True, False):
+        config = dict(DEFAULT_CONFIGURATION, seed=1, days=3)
+        config['batteries'] = dict(config['batteries'], connection_type=connection_type)
+        system = build_system(config)
+        system._batteries._vectorized = vectorized
+        with contextlib.redirect_stdout(io.StringIO()):
+            details = system.fast_forward()
+        results.append((details['battery_array_soc'], details['energy_in'], details['load_errors']))
+    assert results[0] == results[1]
+
+
+def test_cells_take_whole_share_or_nothing():
+    batteries = [Battery(volts=12, amps=100) for _ in range(2)]
+    batteries[0]._available_power = batteries[0]._capacity - 10          # nearly full
+    bank = BatteryBank(batteries, 'parallel')
+    assert bank.charge(100) == 50                                        # the full cell refuses its share
+    assert bank._available_power.tolist() == [batteries[0]._capacity - 10, batteries[1]._available_power + 50]
+
+
+def test_series_string_refuses_when_one_cell_cannot():
+    batteries = [Battery(volts=12, amps=100) for _ in range(2)]
+    batteries[0]._available_power = batteries[0]._capacity - 10
+    bank = BatteryBank(batteries, 'series')
+    assert bank.charge(100) == 0
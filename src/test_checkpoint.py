@@ -0,0 +1,75 @@
+import pytest
+
+from checkpoint import CheckpointStore
+from registry import SimulationRegistry
+
+
+def test_save_tick_save_load_round_trip(tmp_path, running_system):
+    store = CheckpointStore(str(tmp_path))
+    system = running_system()
+    for _ in range(5):
+        system._tick()
+    store.save(system)
+    for _ in range(3):
+        system._tick()
+    store.save(system)
+
+    restored = store.load(system._id, resume=False)
+    for key, series in system.time_series().items():
+        assert restored.time_series()[key].rows() == series.rows(), key
+
+
+def test_tick_while_segment_is_written(tmp_path, running_system):
+    """Rows appended after the history was read must be written by the next save."""
+    store = CheckpointStore(str(tmp_path))
+    system = running_system()
+    system._tick()
+    append_segment = store._append_segment
+
+    def tick_then_append(*args):
+        system._tick()                                  # as the scheduler could, once the lock is released
+        return append_segment(*args)
+
+    store._append_segment = tick_then_append
+    store.save(system)
+    store._append_segment = append_segment
+    for _ in range(3):
+        system._tick()
+    store.save(system)
+
+    restored = store.load(system._id, resume=False)
+    assert restored._iterations == system._iterations
+    for key, series in system.time_series().items():
+        assert restored.time_series()[key].rows() == series.rows(), key
+
+
+def test_ids_outside_the_store_are_rejected(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'store'))
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'state.z').write_bytes(b'')
+    for system_id in ['../outside', str(outside), '..', '.', '']:
+        assert system_id not in store
+        with pytest.raises(ValueError, match='PVS_NOT_FOUND'):
+            store.delete(system_id)
+        with pytest.raises(ValueError, match='PVS_NOT_FOUND'):
+            SimulationRegistry(store=store).remove(system_id)
+    assert (outside / 'state.z').exists()
+
+
+def test_periodic_save_skips_removed_system(tmp_path, running_system):
+    store = CheckpointStore(str(tmp_path))
+    registry = SimulationRegistry(store=store)
+    system = registry.add(running_system())
+    system._tick()
+    store.save(system)
+    system._tick()
+    signature = store._signature
+
+    def remove_then_sign(system):
+        registry.remove(system._id)                     # as a client could, mid pass
+        return signature(system)
+
+    store._signature = remove_then_sign
+    assert store.save_changed(registry) == 0
+    assert system._id not in store
@@ -0,0 +1,35 @@
+import pytest
+
+from cursor import Cursor
+
+
+def test_cursor_returns_only_new_rows(running_system):
+    system = running_system()
+    for _ in range(5):
+        system._tick()
+    assert [row['index'] for row in system.system_data(Cursor(system._id))] == list(range(5))
+    token = system.cursor().encode()
+    inverter_rows = len(system._inverter._time_series)
+    for _ in range(3):
+        system._tick()
+
+    position = Cursor.decode(token, system._id)
+    assert [row['index'] for row in system.system_data(position)] == [5, 6, 7]
+    for panel in system.panel_data(position):
+        assert [row['index'] for row in panel['time_series']] == [5, 6, 7]
+    for battery in system.battery_data(position):
+        assert [row['index'] for row in battery['time_series']] == [5, 6, 7]
+    inverter = system.inverter_data(position)['time_series']
+    assert [row['index'] for row in inverter] == list(range(inverter_rows, len(system._inverter._time_series)))
+
+    caught_up = system.cursor()
+    assert system.system_data(caught_up) == []
+    assert all([panel['time_series'] == [] for panel in system.panel_data(caught_up)])
+
+
+def test_cursor_is_bound_to_its_system(running_system):
+    token = running_system().cursor().encode()
+    with pytest.raises(ValueError, match='INVALID_CURSOR'):
+        Cursor.decode(token, running_system()._id)
+    with pytest.raises(ValueError, match='INVALID_CURSOR'):
+        Cursor.decode('not a cursor', 'PV_SYSTEM')
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from export import ExportReader, export_bytes
+
+
+def assert_matches_snapshot(reader: ExportReader, system, snapshot):
+    """Every table holds exactly the rows published in snapshot."""
+    assert reader.system['current_iteration'] == snapshot.summary['current_iteration']
+    expected = {
+        'system': [(system._time_series, snapshot.ticks)],
+        'inverter': [(system._inverter._time_series, snapshot.inverter)],
+        'panels': [(panel._time_series, length) for panel, _, _, length, _, _ in snapshot.panels],
+        'cooling': [(panel._cooling_system._time_series, length) for panel, _, _, _, _, length in snapshot.panels],
+        'batteries': [(battery._time_series, length) for battery, _, length in snapshot.batteries]
+    }
+    for name, series_list in expected.items():
+        table = reader.table(name)
+        for position, (series, length) in enumerate(series_list):
+            rows = table['component'] == position if 'component' in table else slice(None)
+            assert table['index'][rows].tolist() == list(range(length))
+            for field in series.fields:
+                np.testing.assert_array_equal(table[field][rows], series.column(field, 0, length))
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'raw'])
+def test_export_round_trip(running_system, compression):
+    system = running_system()
+    for _ in range(20):
+        system._tick()
+    system.stop()
+    with ExportReader(export_bytes(system, compression)) as reader:
+        assert reader.tables == ['system', 'panels', 'batteries', 'inverter', 'cooling']
+        assert [component['panel_id'] for component in reader.components('panels')] == \
+            [panel._id for panel in system._panels]
+        assert_matches_snapshot(reader, system, system.snapshot())
+
+
+def test_export_of_running_system_is_one_tick(running_system):
+    system = running_system()
+    for _ in range(5):
+        system._tick()
+    snapshot = system.snapshot()
+    series = system._time_series
+    column = series.column
+
+    def tick_then_column(*args):
+        system._tick()                                  # as the scheduler could, mid export
+        return column(*args)
+
+    series.column = tick_then_column
+    content = export_bytes(system)
+    del series.column
+    assert len(system._time_series) > snapshot.ticks
+    with ExportReader(content) as reader:
+        assert_matches_snapshot(reader, system, snapshot)
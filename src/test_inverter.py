@@ -0,0 +1,28 @@
+import numpy as np
+
+from battery import Battery, BatteryArray
+from inverter import Inverter
+
+
+def charged_array(vectorized: bool = True) -> BatteryArray:
+    battery = Battery(volts=12, amps=100)
+    battery._available_power = 1100
+    battery._max_discharge_rate = 500
+    battery_array = BatteryArray(vectorized=vectorized)
+    battery_array.add(battery)
+    battery_array.status()
+    return battery_array
+
+
+def test_settle_grants_only_what_the_batteries_supply():
+    for vectorized in (True, False):
+        battery_array = charged_array(vectorized)
+        inverter = Inverter(settlement=True)
+        inverter.connect_battery_array(battery_array)
+        granted = inverter.settle([f'cooling-{n}' for n in range(6)], np.full(6, 200.0))
+        assert granted.tolist() == [True] * 2 + [False] * 4             # 500 W discharge rate
+        assert inverter._energy_delivered == 400
+        assert battery_array._energy_out == 400
+        battery_array.status()                          # copies bank state back to the batteries
+        assert next(iter(battery_array))._available_power == 700
+        assert inverter._load_errors == 4
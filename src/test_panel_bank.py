@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+
+class MidpointStream:
+    """Stands in for an environment's random stream: every draw is the middle of its range,
+    so the vectorized and per-panel models see the same values whatever order they draw in."""
+
+    def uniform(self, low, high, size=None):
+        return np.full(size, (low + high) / 2) if size is not None else (low + high) / 2
+
+    def integers(self, low, high, size=None):
+        low = np.asarray(low)
+        return low.copy() if size is not None or low.ndim else int(low)
+
+
+def panel_history(system) -> list:
+    return [
+        (panel._time_series.column('power_output').tolist(), panel._time_series.column('panel_temperature').tolist(),
+         panel._cooling_system._time_series.column('output').tolist())
+        for panel in system._panels
+    ]
+
+
+@pytest.mark.parametrize('cooling', [True, False])
+def test_bank_matches_panel_by_panel_model(running_system, cooling):
+    histories = []
+    for vectorized in (True, False):
+        system = running_system()
+        system._environment._random = MidpointStream()
+        system._panels._vectorized = vectorized
+        if not cooling:
+            system.deactivate_panel_cooling()
+        for _ in range(200):
+            system._tick()
+        histories.append(panel_history(system))
+    np.testing.assert_allclose(np.array(histories[0]), np.array(histories[1]))
@@ -0,0 +1,54 @@
+import threading
+
+
+def test_added_panels_are_wired_before_the_next_tick(running_system, new_panel):
+    system = running_system()
+    system._tick()
+    add_many = system._panels.add_many
+
+    def add_then_tick(panels):
+        result = add_many(panels)
+        system._tick()                                  # as the scheduler could, straight after
+        return result
+
+    system._panels.add_many = add_then_tick
+    system.deactivate_panel_cooling()
+    system.add_panels([new_panel(system._environment) for _ in range(2)])
+    assert system._active
+    assert all([not panel._cooling_system._active for panel in system._panels])
+
+
+def test_stopped_system_publishes_once_per_change(running_system, new_panel):
+    system = running_system()
+    system._tick()
+    system.stop()
+    snapshot = system.snapshot()
+    assert system.snapshot() is snapshot
+    assert system.json()['current_iteration'] == snapshot.summary['current_iteration']
+    system.add_panels([new_panel(system._environment)])
+    assert system.snapshot() is not snapshot
+    assert len(system.snapshot().panels) == len(snapshot.panels) + 1
+
+
+def test_bulk_removal_ignores_repeated_ids(running_system):
+    system = running_system()
+    panel_id = next(iter(system._panels))._id
+    battery_id = next(iter(system._batteries))._id
+    system._panels.remove_many([panel_id, panel_id])
+    system._batteries.remove_many([battery_id, battery_id])
+    assert len(system._panels) == 2 and len(system._batteries) == 1
+    system._tick()
+
+
+
+def test_cooling_toggle_waits_for_the_tick_in_progress(running_system):
+    system = running_system()
+    system._tick()
+    toggler = threading.Thread(target=system.deactivate_panel_cooling)
+    with system._panels._lock:                          # as held by a tick modelling the panels
+        toggler.start()
+        toggler.join(0.1)
+        assert toggler.is_alive()
+        assert system._panels._panel_bank is not None
+    toggler.join()
+    system._tick()
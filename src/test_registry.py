@@ -0,0 +1,31 @@
+from checkpoint import CheckpointStore
+from registry import SimulationRegistry
+
+
+def stopped(running_system, seed: int):
+    system = running_system(seed)
+    for _ in range(50):
+        system._tick()
+    system.stop()
+    return system
+
+
+def test_archive_is_bounded_without_a_store(running_system):
+    registry = SimulationRegistry(max_resident=1, max_archive_bytes=4096)
+    systems = [registry.add(stopped(running_system, seed)) for seed in range(20)]
+    assert len(registry) == 1
+    assert 0 < registry._archive_bytes <= 4096
+    assert registry._archive_bytes == sum([len(archived) for archived in registry._archive.values()])
+    latest = systems[-2]._id                            # most recently evicted
+    assert registry.archived(latest)['summary']['system_id'] == latest
+    assert systems[0]._id not in registry._archive
+
+
+def test_evicted_systems_are_archived_to_the_store(tmp_path, running_system):
+    registry = SimulationRegistry(max_resident=1, store=CheckpointStore(str(tmp_path)))
+    first = registry.add(stopped(running_system, 0))
+    registry.add(stopped(running_system, 1))
+    assert first._id not in registry and len(registry._archive) == 0
+    archived = registry.archived(first._id)
+    assert archived['summary']['current_iteration'] == first._iterations
+    assert archived['system'] == first._time_series.rows()
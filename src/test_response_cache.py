@@ -0,0 +1,47 @@
+import os
+
+os.environ.setdefault('PV_CHECKPOINT_DIR', '')        # keep the app's systems in memory
+
+from fastapi.testclient import TestClient
+
+import main
+from response_cache import ResponseCache, etag_matches
+
+
+def test_matching_etag_gets_304_until_reconfigured(running_system):
+    system = main.SIMULATIONS.add(running_system())
+    system._tick()
+    system.stop()
+    client = TestClient(main.app)
+    try:
+        first = client.put('/pv/system', json={ 'system_id': system._id })
+        etag = first.headers['etag']
+        assert first.status_code == 200 and first.json()['result']['panel_cooling'] is True
+        assert first.headers['cache-control'] == 'no-cache'
+
+        unchanged = client.put('/pv/system', json={ 'system_id': system._id }, headers={ 'If-None-Match': etag })
+        assert unchanged.status_code == 304 and unchanged.content == b''
+
+        system.deactivate_panel_cooling()               # reconfigured
+        changed = client.put('/pv/system', json={ 'system_id': system._id }, headers={ 'If-None-Match': etag })
+        assert changed.status_code == 200 and changed.headers['etag'] != etag
+        assert changed.json()['result']['panel_cooling'] is False
+    finally:
+        main.SIMULATIONS.remove(system._id)
+
+
+def test_cache_stays_within_its_bound():
+    cache = ResponseCache(max_bytes=3 * (ResponseCache.ENTRY_OVERHEAD + 100))
+    for number in range(5):
+        cache.put(('system', 'data', (number,)), 1, bytes(100))
+    assert len(cache) == 3 and cache.nbytes <= 3 * (ResponseCache.ENTRY_OVERHEAD + 100)
+    assert cache.get(('system', 'data', (0,)), 1) is None
+    assert cache.get(('system', 'data', (4,)), 1) is not None
+    assert cache.get(('system', 'data', (4,)), 2) is None          # another version
+
+
+def test_etag_matching():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches('*', '"a"')
+    assert not etag_matches(None, '"a"')
+    assert not etag_matches('"a"', '"b"')
@@ -0,0 +1,22 @@
+import time
+
+import pytest
+
+from scheduler import TickScheduler
+
+
+def test_shutdown_stops_dispatching(running_system):
+    scheduler = TickScheduler(max_workers=2)
+    system = running_system()
+    system._update_interval = 0
+    scheduler.add(system)
+    deadline = time.monotonic() + 5
+    while system._iterations < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.shutdown()
+    assert not scheduler._dispatcher.is_alive()
+    iterations = system._iterations
+    time.sleep(0.05)
+    assert system._iterations == iterations
+    with pytest.raises(RuntimeError):
+        scheduler.add(running_system(seed=1))
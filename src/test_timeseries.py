@@ -0,0 +1,59 @@
+import sys
+import threading
+
+from clock import SimulationClock
+from timeseries import RetentionPolicy, TimeSeries
+
+
+def retained_series(clock: SimulationClock, chunk_size: int = 16) -> TimeSeries:
+    series = TimeSeries({ 'value': 'i8' }, chunk_size=chunk_size)
+    series.set_retention(RetentionPolicy(clock, raw_samples=chunk_size * 4, hourly_buckets=4, daily_buckets=4))
+    return series
+
+
+def test_folded_chunks_are_released():
+    clock = SimulationClock()
+    series = retained_series(clock)
+    for value in range(200):
+        series.append(value)
+        clock.advance()
+    nbytes = series.nbytes
+    for value in range(200, 20000):
+        series.append(value)
+        clock.advance()
+    assert series.nbytes == nbytes
+    assert len(series._chunks['value']) == len(series._ticks) <= 64 // 16 + 2
+    assert series.column('value').tolist() == list(range(series.first_index, 20000))
+    assert series.sum('value') == sum(range(20000))
+
+
+def test_reads_during_folds_are_consistent():
+    clock = SimulationClock()
+    series = retained_series(clock, chunk_size=2)        # fold every other append
+    done = threading.Event()
+    errors = []
+
+    def read():
+        while not done.is_set():
+            length = len(series)
+            start = series.first_index
+            values = series.column('value', 0, length).tolist()
+            if values != list(range(length - len(values), length)):
+                errors.append((start, length, values[:3]))
+            for row in series.rows(start, length):
+                if row.get('resolution') is None and row['value'] != row['index']:
+                    errors.append(row)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)                         # interleave reads with folds as often as possible
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for value in range(20000):
+            series.append(value)
+            clock.advance()
+    finally:
+        done.set()
+        reader.join()
+        sys.setswitchinterval(interval)
+    assert errors == []
@@ -0,0 +1,9 @@
+from utils import uuids
+
+
+def test_bulk_ids_share_no_predictable_part():
+    ids = uuids('PV_SYSTEM', 1000)
+    assert len(set(ids)) == 1000
+    assert all([len(system_id) == len(ids[0]) and system_id.startswith('PV_SYSTEM-') for system_id in ids])
+    first_blocks = [system_id.split('-')[1] for system_id in ids]
+    assert len(set(first_blocks)) > 990             # a shared session or a counter would repeat these
@@ -0,0 +1,63 @@
+import contextlib
+import io
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from sweep import DEFAULT_CONFIGURATION, build_system
+from utils import PhotoVoltaicError
+from weather import WeatherLibrary, convert_csv, write_weather
+
+
+START = datetime(2023, 6, 1)
+
+
+@pytest.fixture
+def library(tmp_path):
+    samples = np.arange(100, dtype=float)
+    write_weather(str(tmp_path / 'short.pvw'), 'short', START, 300, samples * 10, samples)
+    return WeatherLibrary(str(tmp_path))
+
+
+def test_interpolates_between_samples(library):
+    dataset = library.dataset('short')
+    assert dataset is library.dataset('short')                      # one mapping per site
+    assert dataset.at(datetime(2023, 6, 1, 0, 7, 30)) == pytest.approx((15.0, 1.5))
+    with pytest.raises(ValueError):
+        dataset.at(datetime(2023, 5, 31))
+
+
+def test_run_ends_cleanly_at_end_of_data(library):
+    system = build_system(dict(DEFAULT_CONFIGURATION, weather='short', days=3), library)
+    with contextlib.redirect_stdout(io.StringIO()):
+        details = system.fast_forward()
+    assert not system._active
+    assert details['datetime'] == str(library.dataset('short').end)
+    assert len(system._time_series) == 100
+    with pytest.raises(PhotoVoltaicError):
+        system.start()
+
+
+def test_failed_run_is_stopped(library):
+    system = build_system(dict(DEFAULT_CONFIGURATION, weather='short'), library)
+    system._environment.set_time = None                            # the next clock tick raises
+    with pytest.raises(TypeError):
+        system.fast_forward()
+    assert not system._active
+
+
+def test_convert_csv_fills_gaps(tmp_path):
+    source = tmp_path / 'site.csv'
+    source.write_text(
+        'timestamp,solar_irradiance,temperature\n'
+        '2023-06-01T02:00:00+02:00,0,10\n'
+        '2023-06-01T02:05:00+02:00,,11\n'
+        '2023-06-01T02:15:00+02:00,30,13\n'
+    )
+    header = convert_csv(str(source), str(tmp_path / 'site.pvw'))
+    assert (header['site'], header['start'], header['length']) == ('site', '2023-06-01T00:00:00', 4)
+    dataset = WeatherLibrary(str(tmp_path)).dataset('site')
+    assert dataset.column('solar_irradiance').tolist() == [0, 10, 20, 30]
+    assert dataset.column('temperature').tolist() == [10, 11, 12, 13]
@@ -0,0 +1,365 @@
+import numpy as np
+
+from typing import Dict, List, Union
+from collections import deque
+
+from clock import SimulationClock
+
+
+STATIC = None      # schema dtype for fields that hold the same value on every row
+
+
+class _ChunkFolded(Exception):
+    """Raised by a read that overlapped a fold of a chunk into rollups."""
+
+
+class RetentionPolicy:
+    """Bounds how much history a system keeps.
+
+    The most recent raw_samples rows of each series are kept at full resolution. Older
+    rows are folded into hourly and daily rollups (min/max/mean/sum), each of which is a
+    ring holding a fixed number of buckets, so memory stays constant however long the
+    simulation runs. Buckets are based on the simulation clock, not on row counts.
+    """
+
+    def __init__(self, clock: SimulationClock, raw_samples: int = 4096, hourly_buckets: int = 24 * 90,
+                 daily_buckets: int = 3650):
+        self._clock: SimulationClock = clock
+        self._raw_samples: int = raw_samples
+        self._hourly_buckets: int = hourly_buckets
+        self._daily_buckets: int = daily_buckets
+        self._ticks_per_hour: int = max(1, round(3600 / clock.step_seconds))
+
+    @property
+    def tick(self) -> int:
+        return self._clock.steps
+
+    def json(self):
+        """Return json representation of policy."""
+        return {
+            'raw_samples': self._raw_samples,
+            'hourly_buckets': self._hourly_buckets,
+            'daily_buckets': self._daily_buckets,
+            'ticks_per_hour': self._ticks_per_hour
+        }
+
+
+class Rollup:
+    """Fixed capacity ring of min/max/sum aggregates over buckets of clock ticks."""
+
+    def __init__(self, resolution: str, ticks_per_bucket: int, fields: List[str], capacity: int):
+        self._resolution: str = resolution
+        self._ticks_per_bucket: int = ticks_per_bucket
+        self._fields: List[str] = fields
+        self._buckets: deque = deque(maxlen=capacity)     # [bucket, first index, last index, count, stats]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    @property
+    def first_index(self) -> int:
+        """Index of the oldest row still covered by this rollup."""
+        return self._buckets[0][1] if self._buckets else None
+
+    def fold(self, first_index: int, ticks: np.ndarray, values: np.ndarray):
+        """Fold consecutive rows into buckets.
+
+        first_index: index of the first row.
+        ticks: clock tick of every row.
+        values: array of shape (fields, rows).
+        """
+        buckets = ticks // self._ticks_per_bucket
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)]
+        stats = np.stack([
+            np.minimum.reduceat(values, starts, axis=1),
+            np.maximum.reduceat(values, starts, axis=1),
+            np.add.reduceat(values, starts, axis=1)
+        ])                                                   # shape (3, fields, buckets)
+        for position, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            bucket = int(buckets[start])
+            bucket_stats = stats[:, :, position]
+            if self._buckets and self._buckets[-1][0] == bucket:         # bucket spans two folds
+                latest = self._buckets[-1]
+                latest[2] = first_index + end - 1
+                latest[3] += end - start
+                latest[4] = np.stack([
+                    np.minimum(latest[4][0], bucket_stats[0]),
+                    np.maximum(latest[4][1], bucket_stats[1]),
+                    latest[4][2] + bucket_stats[2]
+                ])
+            else:
+                self._buckets.append([bucket, first_index + start, first_index + end - 1, end - start, bucket_stats])
+
+    def state(self) -> list:
+        """Return buckets in a json serialisable form, for checkpoints."""
+        return [[bucket, first, last, count, stats.tolist()] for bucket, first, last, count, stats in self._buckets]
+
+    def restore(self, buckets: list):
+        """Replace buckets with those from Rollup.state."""
+        self._buckets.clear()
+        self._buckets.extend([
+            [bucket, first, last, count, np.array(stats, dtype='f8')] for bucket, first, last, count, stats in buckets
+        ])
+
+    def rows(self, start: int, stop: int, keys: List[str], static: dict) -> List[dict]:
+        """Return buckets overlapping [start, stop) as rows. Field values are bucket means."""
+        rows = []
+        for _, first, last, count, stats in list(self._buckets):     # copied: the tick loop may fold concurrently
+            if last < start or first >= stop:
+                continue
+            minimums, maximums, sums = [stat.tolist() for stat in stats]
+            means = dict(zip(self._fields, [total / count for total in sums]))
+            row = { 'index': first }
+            for key in keys:
+                row[key] = means[key] if key in means else static[key]
+            row['resolution'] = self._resolution
+            row['count'] = count
+            row['min'] = dict(zip(self._fields, minimums))
+            row['max'] = dict(zip(self._fields, maximums))
+            row['sum'] = dict(zip(self._fields, sums))
+            rows.append(row)
+        return rows
+
+
+class TimeSeries:
+    """Columnar, append-only time series.
+
+    Each field is stored in typed numpy chunks of chunk_size rows, allocated as the
+    series grows, so a sample costs only its field widths. Fields marked STATIC in the
+    schema (ids, targets) are stored once. Rows are read back as dicts matching the
+    historical list-of-dicts layout: { 'index': ..., <schema fields in order> }.
+
+    With a RetentionPolicy, whole chunks that fall out of the raw window are folded into
+    hourly and daily rollups, which are served in place of raw rows for older ranges.
+
+    Rows below a length observed after an append never change, so readers bounded by
+    such a length (see PhotoVoltaicSystem.snapshot) need no lock. Folding a chunk is
+    bracketed by a sequence counter, odd while it runs, and a read that overlapped a fold
+    starts again.
+    """
+
+    def __init__(self, schema: Dict[str, Union[str, None]], static: dict = None, chunk_size: int = 1024):
+        """Create an empty series.
+
+        schema: ordered mapping of field name to numpy dtype, or STATIC.
+        static: values for STATIC fields.
+        """
+        self._schema = dict(schema)
+        self._static: dict = dict(static or {})
+        self._fields: List[str] = [field for field, dtype in self._schema.items() if dtype is not STATIC]
+        self._chunk_size: int = chunk_size
+        self._chunks: Dict[str, List[np.ndarray]] = { field: [] for field in self._fields }   # raw chunks only
+        self._length: int = 0
+        self._dropped_chunks: int = 0                  # chunks folded into rollups and released
+        self._folds: int = 0                           # sequence counter, odd while a chunk is folded
+        self._retention: RetentionPolicy = None
+        self._ticks: List[np.ndarray] = []             # clock tick per row, kept when retention is set
+        self._hourly: Rollup = None
+        self._daily: Rollup = None
+        self._dropped_totals: Dict[str, float] = { field: 0.0 for field in self._fields }
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __getitem__(self, key):
+        """Support the list api used by older callers: series[i] and series[start:stop]."""
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('TimeSeries slices do not support steps')
+            start, stop, _ = key.indices(self._length)
+            return self.rows(start, stop)
+        index = key + self._length if key < 0 else key
+        if index < self.first_index or index >= self._length:
+            raise IndexError('TimeSeries index out of range')
+        return self.rows(index, index + 1)[0]
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._fields)
+
+    @property
+    def first_index(self) -> int:
+        """Index of the oldest row still held at full resolution."""
+        return self._dropped_chunks * self._chunk_size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes allocated for column storage."""
+        return sum([chunk.nbytes for chunks in self._chunks.values() for chunk in chunks]) + \
+            sum([chunk.nbytes for chunk in self._ticks])
+
+    def set_retention(self, policy: RetentionPolicy):
+        """Bound the series' memory use. Only allowed before the first append."""
+        if self._length > 0:
+            raise ValueError('Retention must be set before data is recorded.')
+        self._retention = policy
+        self._chunk_size = min(self._chunk_size, policy._raw_samples)
+        self._hourly = Rollup('hour', policy._ticks_per_hour, self._fields, policy._hourly_buckets)
+        self._daily = Rollup('day', policy._ticks_per_hour * 24, self._fields, policy._daily_buckets)
+
+    def append(self, *values):
+        """Append a row. Values are given positionally, in schema order, excluding STATIC fields."""
+        offset = self._length % self._chunk_size
+        if offset == 0:
+            if self._retention is not None:
+                self._ticks.append(np.empty(self._chunk_size, dtype='i8'))
+                if (len(self._ticks) - 1) * self._chunk_size > self._retention._raw_samples:
+                    self._drop_chunk()
+            for field in self._fields:
+                self._chunks[field].append(np.empty(self._chunk_size, dtype=self._schema[field]))
+        if self._retention is not None:
+            self._ticks[-1][offset] = self._retention.tick
+        for field, value in zip(self._fields, values):
+            self._chunks[field][-1][offset] = value
+        self._length += 1
+
+    def column(self, field: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """Return a single field as a numpy array. Only raw rows are returned."""
+        return self._read(self._gather, self._chunks[field], self._schema[field], start, stop)
+
+    def ticks(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """Return the clock tick of each raw row. Ticks are only kept when retention is set."""
+        return self._read(self._gather, self._ticks, 'i8', start, stop)
+
+    def state(self) -> dict:
+        """Return everything except the raw rows in a json serialisable form, for checkpoints."""
+        return {
+            'length': self._length,
+            'chunk_size': self._chunk_size,
+            'dropped_chunks': self._dropped_chunks,
+            'dropped_totals': self._dropped_totals,
+            'hourly': self._hourly.state() if self._hourly is not None else None,
+            'daily': self._daily.state() if self._daily is not None else None
+        }
+
+    def restore(self, state: dict, columns: Dict[str, np.ndarray], ticks: np.ndarray = None):
+        """Load a checkpoint into an empty series. Retention must already be set if it was
+        set on the checkpointed series.
+
+        state: from TimeSeries.state.
+        columns: every field's values for the raw rows, [first_index, length).
+        ticks: clock ticks of the raw rows, required with retention.
+        """
+        if self._length > 0:
+            raise ValueError('Only empty series can be restored.')
+        self._chunk_size = state['chunk_size']
+        self._dropped_chunks = state['dropped_chunks']
+        self._dropped_totals = dict(state['dropped_totals'])
+        self._length = state['length']
+        if self._retention is not None:
+            self._hourly.restore(state['hourly'] or [])
+            self._daily.restore(state['daily'] or [])
+        rows = self._length - self.first_index
+        for position in range(0, rows, self._chunk_size):
+            for field in self._fields:
+                chunk = np.empty(self._chunk_size, dtype=self._schema[field])
+                values = columns[field][position:position + self._chunk_size]
+                chunk[:len(values)] = values
+                self._chunks[field].append(chunk)
+            if self._retention is not None:
+                chunk = np.empty(self._chunk_size, dtype='i8')
+                values = ticks[position:position + self._chunk_size]
+                chunk[:len(values)] = values
+                self._ticks.append(chunk)
+
+    def sum(self, field: str) -> float:
+        """Return the total of a field over the whole series, including folded rows."""
+        return self._dropped_totals[field] + float(self.column(field).sum())
+
+    def rows(self, start: int = 0, stop: int = None) -> List[dict]:
+        """Return rows in [start, stop) as dicts. Ranges older than the raw window are
+        returned as rollup rows (see Rollup.rows)."""
+        return self._read(self._rows, start, stop)
+
+    def _rows(self, start: int, stop: int) -> List[dict]:
+        start, stop = self._bounds(start, stop)
+        first_index = self.first_index
+        rows = self._rollup_rows(start, min(stop, first_index)) if start < first_index else []
+        start = max(start, first_index)
+        keys = ['index', *self._schema.keys()]
+        columns = {
+            field: self._gather(self._chunks[field], self._schema[field], start, stop).tolist()
+            for field in self._fields
+        }
+        values = [range(start, stop)] + [
+            columns[field] if field in columns else [self._static[field]] * (stop - start)
+            for field in self._schema
+        ]
+        rows.extend([dict(zip(keys, row)) for row in zip(*values)])
+        return rows
+
+    def last(self):
+        """Return most recent row, or None if empty."""
+        return self[-1] if self._length > 0 else None
+
+    def _rollup_rows(self, start: int, stop: int) -> List[dict]:
+        """Return daily rollups for ranges older than the hourly window, hourly after that."""
+        if self._retention is None:
+            return []
+        keys = list(self._schema.keys())
+        hourly_start = self._hourly.first_index
+        if hourly_start is None:
+            hourly_start = stop
+        rows = []
+        if start < hourly_start:
+            rows = [
+                row for row in self._daily.rows(start, min(stop, hourly_start), keys, self._static)
+                if row['index'] + row['count'] <= hourly_start    # avoid overlap with hourly rollups
+            ]
+        return rows + self._hourly.rows(max(start, hourly_start), stop, keys, self._static)
+
+    def _drop_chunk(self):
+        """Fold the oldest raw chunk into the rollups and release it."""
+        self._folds += 1                                   # concurrent readers retry (see _read)
+        first_index = self.first_index
+        ticks = self._ticks.pop(0)
+        values = np.stack([self._chunks[field].pop(0).astype('f8') for field in self._fields])
+        for field, total in zip(self._fields, values.sum(axis=1).tolist()):
+            self._dropped_totals[field] += total
+        self._hourly.fold(first_index, ticks, values)
+        self._daily.fold(first_index, ticks, values)
+        self._dropped_chunks += 1
+        self._folds += 1
+
+    def _read(self, read, *args):
+        """Run a lock-free read, again until no chunk was folded while it ran."""
+        while True:
+            folds = self._folds
+            try:
+                result = read(*args)
+            except _ChunkFolded:
+                continue
+            if folds % 2 == 0 and self._folds == folds:
+                return result
+
+    def _gather(self, chunks: List[np.ndarray], dtype: str, start: int, stop: int) -> np.ndarray:
+        """Copy raw rows in [start, stop) out of a list of chunks."""
+        start, stop = self._bounds(max(start, self.first_index), stop)
+        parts = []
+        for chunk, first, last in self._chunk_ranges(start, stop):
+            if not 0 <= chunk < len(chunks):               # shifted by a concurrent fold
+                raise _ChunkFolded()
+            parts.append(chunks[chunk][first:last])
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return parts[0].copy() if len(parts) == 1 else np.concatenate(parts)
+
+    def _bounds(self, start: int, stop: int):
+        """Clamp a [start, stop) range to the stored rows."""
+        stop = self._length if stop is None else min(stop, self._length)
+        start = max(0, min(start, stop))
+        return start, stop
+
+    def _chunk_ranges(self, start: int, stop: int):
+        """Yield (position in the chunk lists, first offset, last offset) covering raw rows
+        in [start, stop)."""
+        position = start
+        while position < stop:
+            chunk, first = divmod(position, self._chunk_size)
+            last = min(self._chunk_size, first + (stop - position))
+            yield chunk - self._dropped_chunks, first, last
+            position += last - first
@@ -1,6 +1,6 @@
-import re
 import secrets
-import random
+
+import numpy as np
 
 from simulator_types import Percentage
 
@@ -14,21 +14,58 @@ def calculate_watts(volts, amps):
 
 def uuid(prefix: str='xxxxxxxx'):
     """Generate uuid with optional prefix."""
+    return uuids(prefix, 1)[0]
+
+def uuids(prefix: str='xxxxxxxx', count: int = 1):
+    """Allocate count uuids with a shared prefix in one call. Ids are the only key
+    clients need to read or delete a system, so every digit after the prefix is random."""
     if len(prefix) > 10:
         raise ValueError('uuid prefixes cannot exceed 10 characters')
+    if prefix == 'xxxxxxxx':                                  # default prefix is random
+        prefix = secrets.token_hex(4)
     first_block_chars = 16 - len(prefix)
-    first_block = 'x' * first_block_chars
-    return re.sub('x', lambda m: secrets.choice('0123456789abcdef'),
-                  f'{prefix}-{first_block}-xxxx-xxxx-xxxx-xxxxxxxx')
+    digits_per_id = first_block_chars + 20
+    digits = secrets.token_hex(-(-digits_per_id * count // 2))
+    blocks = [0, first_block_chars, first_block_chars + 4, first_block_chars + 8, first_block_chars + 12,
+              digits_per_id]
+    ids = []
+    for position in range(0, digits_per_id * count, digits_per_id):
+        ids.append('-'.join([prefix] + [digits[position + start:position + end]
+                                        for start, end in zip(blocks, blocks[1:])]))
+    return ids
+
+def random_seed() -> int:
+    """Return a fresh seed. Kept within 53 bits so it survives a round trip through json clients."""
+    return secrets.randbits(53)
 
-def variation(value, variance: Percentage = 0.3):
+def random_stream(seed: int = None) -> np.random.Generator:
+    """Return an independent random stream. Equal seeds give equal streams in any thread or process."""
+    return np.random.default_rng(seed)
+
+_default_stream = random_stream()          # for callers that don't own a stream
+
+def variation(value, variance: Percentage = 0.3, rng: np.random.Generator = None):
     """Create realistic variance in output values."""
     if value > 10:
-        decimal = random.randrange(0, 99) * 0.01
+        rng = rng or _default_stream
+        decimal = int(rng.integers(0, 99)) * 0.01
         min_value = value - (value * variance)
-        return random.randrange(int(min_value), int(value)) + decimal
+        return int(rng.integers(int(min_value), int(value))) + decimal
     return value
 
+def batch_variation(values: np.ndarray, variance: Percentage = 0.3, rng: np.random.Generator = None) -> np.ndarray:
+    """Vectorised `variation`; applies variance to a whole array of values in one draw."""
+    rng = rng or _default_stream
+    values = np.asarray(values, dtype=float)
+    varied = values.copy()
+    mask = values > 10
+    count = int(mask.sum())
+    if count > 0:
+        decimal = rng.integers(0, 99, count) * 0.01
+        min_values = values[mask] - (values[mask] * variance)
+        varied[mask] = rng.integers(min_values.astype(int), values[mask].astype(int)) + decimal
+    return varied
+
 class PhotoVoltaicError(Exception):
     """Indicates a PV misconfiguration."""
     pass
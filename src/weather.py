@@ -0,0 +1,280 @@
+"""Recorded weather for environments.
+
+Weather is stored per site in a compact binary file: a preamble (magic, version, header
+length), a json header describing the site and its sampling grid, then one float32
+column per field, each aligned to ALIGNMENT bytes. Samples lie on a regular grid of
+step_seconds from start, so a time maps to a position without searching. Files are
+memory-mapped, so opening a multi-year dataset reads only the header and the pages a
+simulation touches, and every environment at a site shares one mapping.
+
+Convert recorded data from csv with:
+
+    python weather.py input.csv output.pvw --site <name>
+"""
+from typing import Dict, List, Tuple
+from simulator_types import Celcius, Watt
+
+from datetime import datetime, timedelta, timezone
+
+import argparse
+import csv
+import json
+import os
+import struct
+import threading
+import weakref
+
+import numpy as np
+
+
+MAGIC = b'PVWX'
+VERSION = 1
+ALIGNMENT = 64
+EXTENSION = '.pvw'
+FIELDS = ('solar_irradiance', 'temperature')
+EPOCH = datetime(1970, 1, 1)          # naive, like the simulation clock
+
+_PREAMBLE = struct.Struct('<4sHI')     # magic, version, header length
+
+
+def _aligned(size: int) -> int:
+    """Round size up to a multiple of ALIGNMENT."""
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _seconds(when: datetime) -> float:
+    """Seconds since EPOCH. Aware times are converted to UTC; naive times are used as they are."""
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return (when - EPOCH).total_seconds()
+
+
+def write_weather(target: str, site: str, start: datetime, step_seconds: int, solar_irradiance: np.ndarray,
+                  temperature: np.ndarray):
+    """Write a weather file from columns sampled every step_seconds from start."""
+    columns = { 'solar_irradiance': solar_irradiance, 'temperature': temperature }
+    length = len(solar_irradiance)
+    if len(temperature) != length:
+        raise ValueError('Weather columns must have the same length.')
+    header = {
+        'version': VERSION,
+        'site': site,
+        'start': (EPOCH + timedelta(seconds=_seconds(start))).isoformat(),
+        'step_seconds': step_seconds,
+        'length': length,
+        'columns': []
+    }
+    position = 0
+    for name in FIELDS:
+        header['columns'].append({ 'name': name, 'dtype': '<f4', 'offset': position })
+        position += _aligned(length * 4)
+    encoded = json.dumps(header, separators=(',', ':')).encode()
+    data_start = _aligned(_PREAMBLE.size + len(encoded))
+    with open(target, 'wb') as file:
+        file.write(_PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+        file.write(encoded)
+        file.write(b'\0' * (data_start - _PREAMBLE.size - len(encoded)))
+        for name in FIELDS:
+            blob = np.ascontiguousarray(columns[name], dtype='<f4').tobytes()
+            file.write(blob)
+            file.write(b'\0' * (-len(blob) % ALIGNMENT))
+
+
+def convert_csv(source: str, target: str, site: str = None, time_column: str = 'timestamp',
+                irradiance_column: str = 'solar_irradiance', temperature_column: str = 'temperature',
+                step_seconds: int = None) -> dict:
+    """Convert a csv of recorded weather to a weather file. Returns the file's header.
+
+    Rows are placed on a regular grid of step_seconds (by default the most common
+    interval between rows) and gaps, including empty cells, are filled by linear
+    interpolation. Timestamps are ISO 8601; those with an offset are converted to UTC.
+
+    site: defaults to the target file's name without its extension.
+    """
+    times, irradiance, temperature = [], [], []
+    with open(source, newline='') as file:
+        for row in csv.DictReader(file):
+            times.append(_seconds(datetime.fromisoformat(row[time_column].strip())))
+            irradiance.append(float(row[irradiance_column]) if row[irradiance_column].strip() else np.nan)
+            temperature.append(float(row[temperature_column]) if row[temperature_column].strip() else np.nan)
+    if len(times) < 2:
+        raise ValueError('At least two rows are required.')
+    times = np.array(times)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    if step_seconds is None:
+        intervals = np.diff(times)
+        values, counts = np.unique(intervals[intervals > 0], return_counts=True)
+        step_seconds = int(values[counts.argmax()])
+    positions = np.rint((times - times[0]) / step_seconds).astype('i8')
+    grid = np.arange(positions[-1] + 1)
+    columns = []
+    for values in (irradiance, temperature):
+        samples = np.full(len(grid), np.nan)
+        samples[positions] = np.array(values)[order]     # later rows win where two round to one position
+        known = ~np.isnan(samples)
+        if not known.any():
+            raise ValueError('A weather column has no values.')
+        samples[~known] = np.interp(grid[~known], grid[known], samples[known])
+        columns.append(samples)
+    site = site or os.path.splitext(os.path.basename(target))[0]
+    write_weather(target, site, EPOCH + timedelta(seconds=times[0]), step_seconds, *columns)
+    with WeatherDataset(target) as dataset:
+        return dataset.header
+
+
+class WeatherDataset:
+    """A memory-mapped weather file. Obtain shared instances through open_dataset."""
+
+    def __init__(self, path: str):
+        self._path: str = os.path.realpath(path)
+        with open(self._path, 'rb') as file:
+            preamble = file.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise ValueError('INVALID_WEATHER_FILE')
+            magic, version, header_length = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise ValueError('INVALID_WEATHER_FILE')
+            if version > VERSION:
+                raise ValueError(f'UNSUPPORTED_WEATHER_VERSION: {version}')
+            self._header: dict = json.loads(file.read(header_length))
+        data_start = _aligned(_PREAMBLE.size + header_length)
+        self._length: int = self._header['length']
+        self._step: float = float(self._header['step_seconds'])
+        self._start: float = _seconds(datetime.fromisoformat(self._header['start']))
+        self._columns: Dict[str, np.memmap] = {
+            column['name']: np.memmap(self._path, dtype=column['dtype'], mode='r',
+                                      offset=data_start + column['offset'], shape=(self._length,))
+            for column in self._header['columns']
+        }
+        self._solar_irradiance: np.memmap = self._columns['solar_irradiance']
+        self._temperature: np.memmap = self._columns['temperature']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def site(self) -> str:
+        return self._header['site']
+
+    @property
+    def header(self) -> dict:
+        return self._header
+
+    @property
+    def start(self) -> datetime:
+        return datetime.fromisoformat(self._header['start'])
+
+    @property
+    def end(self) -> datetime:
+        """Time of the last sample."""
+        return EPOCH + timedelta(seconds=self._start + self._step * (self._length - 1))
+
+    @property
+    def step_seconds(self) -> float:
+        return self._step
+
+    def column(self, name: str) -> np.ndarray:
+        """Return a field as a read-only view of the mapping."""
+        return self._columns[name]
+
+    def covers(self, when: datetime) -> bool:
+        position = (_seconds(when) - self._start) / self._step
+        return 0 <= position <= self._length - 1
+
+    def at(self, when: datetime) -> Tuple[Watt, Celcius]:
+        """Return (solar irradiance, temperature) at a time, interpolated linearly between
+        the two nearest samples."""
+        position = (_seconds(when) - self._start) / self._step
+        if position < 0 or position > self._length - 1:
+            raise ValueError(f'OUTSIDE_WEATHER_DATA: {when} is not covered by {self.site}')
+        index = int(position)
+        fraction = position - index
+        if fraction == 0:                               # clock steps usually land on samples
+            return float(self._solar_irradiance[index]), float(self._temperature[index])
+        irradiance = self._solar_irradiance[index:index + 2].tolist()
+        temperature = self._temperature[index:index + 2].tolist()
+        return (
+            irradiance[0] + (irradiance[1] - irradiance[0]) * fraction,
+            temperature[0] + (temperature[1] - temperature[0]) * fraction
+        )
+
+    def json(self):
+        """Return json representation of dataset."""
+        return {
+            'site': self.site,
+            'start': str(self.start),
+            'end': str(self.end),
+            'step_seconds': self._step,
+            'samples': self._length
+        }
+
+    def close(self):
+        """Drop the mappings; they are unmapped once no views remain. Datasets shared through
+        open_dataset are released when the last environment using them is collected, and
+        should not be closed directly."""
+        self._columns = {}
+        self._solar_irradiance = self._temperature = None
+
+
+_datasets = weakref.WeakValueDictionary()              # realpath -> WeatherDataset
+_datasets_lock = threading.Lock()
+
+
+def open_dataset(path: str) -> WeatherDataset:
+    """Return the dataset for a weather file, shared with every other caller that has it open."""
+    key = os.path.realpath(path)
+    with _datasets_lock:
+        dataset = _datasets.get(key)
+        if dataset is None:
+            dataset = _datasets[key] = WeatherDataset(key)
+        return dataset
+
+
+class WeatherLibrary:
+    """A directory of weather files, one per site, named <site>.pvw."""
+
+    def __init__(self, directory: str):
+        self._directory: str = directory
+
+    def sites(self) -> List[str]:
+        """Return the names of every available site."""
+        if not os.path.isdir(self._directory):
+            return []
+        return sorted([
+            entry[:-len(EXTENSION)] for entry in os.listdir(self._directory) if entry.endswith(EXTENSION)
+        ])
+
+    def dataset(self, site: str) -> WeatherDataset:
+        """Return the shared dataset for a site."""
+        path = os.path.join(self._directory, site + EXTENSION)
+        if os.path.basename(site) != site or not os.path.exists(path):
+            raise ValueError(f'UNKNOWN_SITE: {site}')
+        return open_dataset(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert recorded weather from csv to a weather file.')
+    parser.add_argument('source', help='csv with a timestamp, irradiance and temperature column')
+    parser.add_argument('target', help=f'weather file to write, conventionally <site>{EXTENSION}')
+    parser.add_argument('--site', help='site name, defaults to the target file name')
+    parser.add_argument('--time-column', default='timestamp')
+    parser.add_argument('--irradiance-column', default='solar_irradiance')
+    parser.add_argument('--temperature-column', default='temperature')
+    parser.add_argument('--step-seconds', type=int, help='sampling interval, inferred when omitted')
+    args = parser.parse_args()
+
+    header = convert_csv(args.source, args.target, args.site, args.time_column, args.irradiance_column,
+                         args.temperature_column, args.step_seconds)
+    print(f'Wrote {header["length"]} samples for {header["site"]} from {header["start"]}, '
+          f'every {header["step_seconds"]} seconds, to {args.target}')